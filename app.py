@@ -1,27 +1,182 @@
-from flask import Flask, render_template, redirect, abort, url_for, flash, request, current_app, send_file, Response
+from flask import Flask, render_template, redirect, abort, url_for, flash, request, send_file, Response, g, has_app_context, jsonify, stream_with_context
 from flask_login import LoginManager, UserMixin, current_user, login_required, login_user, logout_user
-from datetime import datetime
+from datetime import datetime, date, timedelta, timezone
+from decimal import Decimal, InvalidOperation
+from operator import attrgetter
 from flask_migrate import Migrate
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileAllowed
 from wtforms import StringField, PasswordField, BooleanField, SubmitField, DecimalField, DateField, SelectField, FileField
 from wtforms.validators import DataRequired, Length, NumberRange
+from flask.sessions import SecureCookieSessionInterface
+from werkzeug.datastructures import FileStorage
 from werkzeug.security import check_password_hash
-from werkzeug.utils import secure_filename
+from PIL import Image, ImageOps, ExifTags
 from functools import wraps
-from xml.etree.ElementTree import Element, SubElement, tostring
-from xml.dom import minidom
+from collections import namedtuple, defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from sqlalchemy import tuple_, event, text, func, insert, update, exists, inspect
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload, contains_eager, selectinload, Session
+from xml.etree.ElementTree import iterparse, ParseError
+from xml.sax.saxutils import escape as xml_escape
+import base64
+import click
+import csv
+import gzip
 import hashlib
+import io
+import itertools
+import json
+import mimetypes
 import os
+import re
+import time
+import uuid
 from config import Config
-from models import db, User, Equipment, Category, Photo, Role
+from cache import CountCache, DataVersion, PageCache, VersionedValue, FileArtifact, DiskLRUCache
+from storage import PhotoStore, file_md5
+from models import db, User, Equipment, Category, Photo, Role, MaintenanceLog, DeletedEquipment
+
+class SessionInterface(SecureCookieSessionInterface):
+    """Cookie-сессия, которая не трогает ответы с immutable-кэшем (фото и их варианты).
+
+    Такие ответы одинаковы для всех пользователей, а Flask-Login читает сессию в after_request
+    на каждом запросе - из-за этого Flask добавлял бы Vary: Cookie (и мог обновить cookie),
+    и общий кэш или фронт-прокси хранили бы по копии файла на каждую сессию.
+    """
+
+    def save_session(self, app, session, response):
+        if response.cache_control.immutable and not session.modified:
+            return
+        super().save_session(app, session, response)
+
 
 app = Flask(__name__)
 app.config.from_object(Config)
+app.session_interface = SessionInterface()
 
 db.init_app(app)
 migrate = Migrate(app, db)  # Для миграций базы данных
 
+data_version = DataVersion(os.path.join(app.instance_path, 'data_version'))
+category_version = DataVersion(os.path.join(app.instance_path, 'data_version_category'))
+count_cache = CountCache(ttl=app.config['COUNT_CACHE_TTL'])
+page_cache = PageCache(max_bytes=app.config['PAGE_CACHE_MAX_BYTES'])
+export_artifact = FileArtifact(os.path.join(app.instance_path, 'exports'), 'equipment-{version}.xml.gz', data_version)
+photo_store = PhotoStore(os.path.join(app.root_path, app.config['UPLOAD_FOLDER']))
+resized_cache = DiskLRUCache(os.path.join(app.instance_path, 'resized'), app.config['RESIZE_CACHE_MAX_BYTES'])
+facet_cache = CountCache(ttl=app.config['COUNT_CACHE_TTL'])
+
+# Модели, запись в которые меняет содержимое списка и карточек оборудования
+VERSIONED_MODELS = (Equipment, Category, Photo, MaintenanceLog)
+
+
+def get_data_version():
+    """Текущая версия данных; в пределах одного запроса файл читается один раз."""
+    if 'data_version' not in g:
+        g.data_version = data_version.current()
+    return g.data_version
+
+
+def invalidate_local_caches():
+    """Освобождает кэши этого процесса (другие процессы узнают о записи по смене версии данных)."""
+    count_cache.invalidate()
+    facet_cache.invalidate()
+    page_cache.invalidate()
+
+
+def make_etag(*parts):
+    """ETag страницы: хэш версии данных и всего, от чего ещё зависит её содержимое."""
+    return hashlib.md5(repr((get_data_version(),) + parts).encode('utf-8')).hexdigest()
+
+
+def not_modified(etag, last_modified):
+    """True, если у клиента уже есть актуальная версия (If-None-Match важнее If-Modified-Since)."""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return request.if_modified_since >= last_modified.replace(microsecond=0)
+    return False
+
+
+def with_validators(response, etag, last_modified):
+    """Добавляет к ответу ETag/Last-Modified; страница зависит от пользователя, поэтому кэш только частный."""
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Cookie')
+    return response
+
+
+def mark_data_changed(session, *models):
+    """Для массовых insert/update в обход объектов ORM: after_commit всё равно поднимет версию данных."""
+    session.info.setdefault('changed_models', set()).update(models)
+
+
+@event.listens_for(Session, 'before_flush')
+def record_deleted_equipment(session, flush_context, instances):
+    # Отметки об удалении нужны инкрементальной выгрузке в 1С (export_to_1c?since=...)
+    for obj in session.deleted:
+        if isinstance(obj, Equipment):
+            session.add(DeletedEquipment(equipment_id=obj.id, inventory_number=obj.inventory_number))
+    # 1С узнаёт строку только по инвентарному номеру: при его смене старый номер для неё - удалённая запись
+    for obj in session.dirty:
+        if isinstance(obj, Equipment) and obj.id is not None:
+            for old_number in inspect(obj).attrs.inventory_number.history.deleted:
+                if old_number and old_number != obj.inventory_number:
+                    session.add(DeletedEquipment(equipment_id=obj.id, inventory_number=old_number))
+
+
+@event.listens_for(Session, 'before_flush')
+def touch_renamed_category_equipment(session, flush_context, instances):
+    # Название категории входит в выгрузку для 1С, а дельта (since=...) отбирает строки по updated_at:
+    # при переименовании помечаем всё оборудование категории одним UPDATE
+    renamed = [obj.id for obj in session.dirty
+               if isinstance(obj, Category) and obj.id is not None and inspect(obj).attrs.name.history.has_changes()]
+    if renamed:
+        session.execute(update(Equipment).where(Equipment.category_id.in_(renamed)).values(updated_at=datetime.utcnow()),
+                        execution_options={'synchronize_session': False})
+        mark_data_changed(session, Equipment)
+
+
+@event.listens_for(Session, 'after_flush')
+def track_versioned_changes(session, flush_context):
+    changed = session.info.setdefault('changed_models', set())
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, VERSIONED_MODELS):
+            changed.add(type(obj))
+
+
+@event.listens_for(Session, 'after_commit')
+def bump_data_version(session):
+    changed = session.info.pop('changed_models', set())
+    if changed:
+        data_version.bump()
+        if has_app_context():
+            g.pop('data_version', None)
+        invalidate_local_caches()
+    if Category in changed:
+        category_version.bump()
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_versioned_changes(session):
+    session.info.pop('changed_models', None)
+
+
+CategoryItem = namedtuple('CategoryItem', ['id', 'name'])
+
+
+def load_categories():
+    # Кэшируем простые кортежи, а не объекты ORM: те привязаны к сессии конкретного запроса
+    return [CategoryItem(c.id, c.name) for c in Category.query.order_by(Category.name, Category.id)]
+
+
+# Справочник категорий для фильтра списка и выбора в формах; перечитывается только после записи в Category
+category_cache = VersionedValue(category_version, load_categories)
+
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -30,7 +185,8 @@ login_manager.login_message = "Для выполнения данного дей
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Роль подгружаем тем же запросом: шаблоны и role_required обращаются к ней на каждом запросе
+    return db.session.get(User, int(user_id), options=[joinedload(User.role)])
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
@@ -38,6 +194,18 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def uploaded_file(field):
+    """Файл, загруженный через поле формы, или None.
+
+    В форме, созданной с obj=equipment, без новой загрузки в поле photo лежит текущий Photo,
+    а не FileStorage - такой объект загрузкой не считается.
+    """
+    data = field.data
+    if isinstance(data, FileStorage) and data.filename and allowed_file(data.filename):
+        return data
+    return None
+
+
 class LoginForm(FlaskForm):
     username = StringField('Имя пользователя', validators=[DataRequired(), Length(min=4, max=20)])
     password = PasswordField('Пароль', validators=[DataRequired()])
@@ -78,22 +246,195 @@ def role_required(role):
     return decorator
 
 
-def generate_md5(filename):
-    """Генерирует MD5 хэш для указанного файла."""
-    md5_hash = hashlib.md5()
+# Ключи сортировки списка: sort_by -> [(выражение для ORDER BY, атрибут строки), ...].
+# К каждому ключу добавляется Equipment.id, чтобы порядок был однозначным. Категория сортируется
+# по (Category.name, Category.id): так SQLite идёт по ix_category_name и ix_equipment_category без сортировки в памяти
+# (порядок соединения для этого закрепляет equipment_list_query). Поэтому запрос списка всегда соединён с category.
+SORT_COLUMNS = {
+    'name': [(Equipment.name, 'name')],
+    'inventory_number': [(Equipment.inventory_number, 'inventory_number')],
+    'category': [(Category.name, 'category.name'), (Category.id, 'category_id')],
+    'status': [(Equipment.status, 'status')],
+    'purchase_date': [(Equipment.purchase_date, 'purchase_date')],
+}
+
+
+def sort_key(sort_by, category_filter=None, status_filter=None):
+    """Возвращает полный ключ сортировки для sort_by (по умолчанию - дата покупки) с Equipment.id на конце."""
+    key = SORT_COLUMNS.get(sort_by, SORT_COLUMNS['purchase_date'])
+    # Если фильтр и так фиксирует значение сортируемого столбца, порядок задаёт один id.
+    # Лишнее условие на этот столбец в курсоре сбивает планировщик SQLite на полный скан.
+    if (sort_by == 'status' and status_filter) or (sort_by == 'category' and category_filter):
+        key = []
+    return key + [(Equipment.id, 'id')]
+
+
+def key_values(item, key):
+    """Значения ключа сортировки для строки списка."""
+    return tuple(attrgetter(attr)(item) for _, attr in key)
+
+
+def encode_cursor(values):
+    """Кодирует позицию в списке (значения ключа сортировки) в непрозрачный курсор для URL."""
+    values = [value.isoformat() if isinstance(value, date) else value for value in values]
+    raw = json.dumps(values, ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, key):
+    """Разбирает курсор обратно в значения ключа сортировки. Для битого курсора возвращает None."""
     try:
-        with open(filename, "rb") as f:  # Открываем файл в бинарном режиме
-            for chunk in iter(lambda: f.read(4096), b""):  # 4096 байт - размер чанка
-                md5_hash.update(chunk)
-        return md5_hash.hexdigest()  # Возвращаем хэш в шестнадцатеричном формате
-    except FileNotFoundError:
-        print(f"Файл не найден: {filename}")
-        return None
-    except Exception as e:
-        print(f"Ошибка при чтении файла: {e}")
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(key):
+            return None
+        result = []
+        for (column, _), value in zip(key, values):
+            python_type = column.type.python_type
+            # Даты в курсоре хранятся строками ISO; bool в JSON - подкласс int, его не пропускаем
+            expected = str if python_type is date else python_type
+            if not isinstance(value, expected) or isinstance(value, bool):
+                return None
+            result.append(date.fromisoformat(value) if python_type is date else value)
+        return tuple(result)
+    except (ValueError, TypeError):
         return None
 
 
+class KeysetPagination:
+    """Страница списка, выбранная по курсору (keyset/seek) - без OFFSET и без COUNT(*)."""
+
+    def __init__(self, items, per_page, key, has_prev, has_next):
+        self.items = items
+        self.per_page = per_page
+        self.has_prev = has_prev and bool(items)
+        self.has_next = has_next and bool(items)
+        self.prev_cursor = encode_cursor(key_values(items[0], key)) if self.has_prev else None
+        self.next_cursor = encode_cursor(key_values(items[-1], key)) if self.has_next else None
+
+
+def equipment_list_query(key=()):
+    """Базовый запрос списка: оборудование вместе с категорией (нужна и в строках таблицы, и для сортировки).
+
+    Если ключ сортировки key начинается с категории, соединение идёт по category.id + 0: выражение
+    закрывает поиск категории по первичному ключу, и SQLite без статистики (ANALYZE) всё равно
+    ведёт запрос от ix_category_name к ix_equipment_category, а не сортирует всю таблицу в памяти.
+    """
+    if any(column is Category.name for column, _ in key):
+        query = Equipment.query.join(Category, Equipment.category_id == Category.id + 0)
+    else:
+        query = Equipment.query.join(Equipment.category)
+    return query.options(contains_eager(Equipment.category))
+
+
+def filter_equipment(query, category_filter=None, status_filter=None, date_from=None, date_to=None):
+    """Накладывает на запрос фильтры списка: категория, статус и диапазон дат покупки (строки YYYY-MM-DD)."""
+    if category_filter:
+        query = query.filter(Equipment.category_id == category_filter)
+    if status_filter:
+        query = query.filter(Equipment.status == status_filter)
+
+    if date_from:
+        date_from_dt = datetime.strptime(date_from, '%Y-%m-%d').date()
+        query = query.filter(Equipment.purchase_date >= date_from_dt)
+    if date_to:
+        date_to_dt = datetime.strptime(date_to, '%Y-%m-%d').date()
+        query = query.filter(Equipment.purchase_date <= date_to_dt)
+    return query
+
+
+def filter_signature(category_filter=None, status_filter=None, date_from=None, date_to=None):
+    """Нормализованный кортеж фильтров: пустые значения -> None, даты -> YYYY-MM-DD."""
+    def normalize_date(value):
+        return datetime.strptime(value, '%Y-%m-%d').date().isoformat() if value else None
+
+    return (category_filter or None, status_filter or None, normalize_date(date_from), normalize_date(date_to))
+
+
+def count_equipment(signature):
+    """Возвращает (число строк под фильтром, приблизительно ли оно), по возможности из кэша.
+
+    В режиме COUNT_MODE = 'approximate' подсчёт останавливается на COUNT_APPROX_LIMIT строках,
+    так что на огромных выборках он не проходит весь индекс.
+    """
+    cache_key = (get_data_version(), signature)
+    cached = count_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    query = filter_equipment(Equipment.query, *signature)
+    if app.config['COUNT_MODE'] == 'approximate':
+        limit = app.config['COUNT_APPROX_LIMIT']
+        capped = query.with_entities(Equipment.id).limit(limit + 1).subquery()
+        total = db.session.query(func.count()).select_from(capped).scalar()
+        result = (min(total, limit), total > limit)
+    else:
+        result = (query.with_entities(func.count(Equipment.id)).scalar(), False)
+
+    count_cache.set(cache_key, result)
+    return result
+
+
+def facet_counts(signature):
+    """Счётчики для фильтров списка: ({category_id: n}, {status: n}) в текущем контексте фильтра.
+
+    Собственный фильтр фасета не учитывается, иначе остальные варианты всегда показывали бы 0.
+    Оба фасета получаются из одного GROUP BY (category_id, status) с фильтром по датам,
+    результат которого кэшируется вместе с версией данных.
+    """
+    category_filter, status_filter, date_from, date_to = signature
+    cache_key = (get_data_version(), date_from, date_to)
+    groups = facet_cache.get(cache_key)
+    if groups is None:
+        query = db.session.query(Equipment.category_id, Equipment.status, func.count(Equipment.id))
+        query = filter_equipment(query, date_from=date_from, date_to=date_to)
+        groups = [tuple(row) for row in query.group_by(Equipment.category_id, Equipment.status)]
+        facet_cache.set(cache_key, groups)
+
+    by_category, by_status = defaultdict(int), defaultdict(int)
+    for category_id, status, count in groups:
+        if not status_filter or status == status_filter:
+            by_category[category_id] += count
+        if not category_filter or category_id == category_filter:
+            by_status[status] += count
+    return by_category, by_status
+
+
+def order_equipment(query, key, descending):
+    """Упорядочивает запрос по всем столбцам ключа сортировки в одном направлении."""
+    return query.order_by(*(column.desc() if descending else column.asc() for column, _ in key))
+
+
+def keyset_query(query, key, descending, cursor=None, backwards=False):
+    """Упорядочивает запрос по ключу и отсекает строки до курсора (или после него - при backwards)."""
+    # При движении назад идём в обратном порядке, а затем разворачиваем результат
+    scan_desc = descending != backwards
+    row = tuple_(*(column for column, _ in key))
+
+    if cursor is not None:
+        query = query.filter(row < tuple_(*cursor) if scan_desc else row > tuple_(*cursor))
+    return order_equipment(query, key, scan_desc)
+
+
+def keyset_paginate(query, key, descending, per_page, after=None, before=None):
+    """Возвращает страницу после курсора after (или перед курсором before).
+
+    Ключ сортировки заканчивается на Equipment.id, поэтому порядок однозначен,
+    а каждая страница стоит одного запроса с LIMIT независимо от её номера.
+    """
+    backwards = before is not None
+    query = keyset_query(query, key, descending, before if backwards else after, backwards)
+
+    items = query.limit(per_page + 1).all()
+    has_more = len(items) > per_page
+    items = items[:per_page]
+
+    if backwards:
+        items.reverse()
+        return KeysetPagination(items, per_page, key, has_prev=has_more, has_next=True)
+    return KeysetPagination(items, per_page, key, has_prev=after is not None, has_next=has_more)
+
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
@@ -120,8 +461,30 @@ def logout():
     return redirect(url_for('index'))
 
 
+# Параметры запроса, от которых зависит страница списка (остальные в ключ кэша не входят)
+LIST_ARGS = ('page', 'sort_by', 'sort_order', 'category', 'status', 'date_from', 'date_to', 'after', 'before')
+
+
+def list_page_cache_key():
+    """Ключ кэша страницы списка: версия данных, режим пагинации, роль пользователя и непустые параметры."""
+    role = current_user.role.name if current_user.is_authenticated else None
+    args = tuple((name, request.args[name]) for name in LIST_ARGS if request.args.get(name))
+    return get_data_version(), app.config['PAGINATION_MODE'], app.config['PER_PAGE'], role, args
+
+
 @app.route('/')
 def index():
+    # Повторный просмотр той же страницы при неизменных данных не трогает ни БД, ни шаблон,
+    # а если страница уже есть у клиента - отвечаем 304 без тела
+    cache_key = list_page_cache_key()
+    etag, last_modified = make_etag(*cache_key[1:]), data_version.last_modified()
+    if not_modified(etag, last_modified):
+        return with_validators(Response(status=304), etag, last_modified)
+    if app.config['PAGE_CACHE_MAX_BYTES']:
+        body = page_cache.get(cache_key)
+        if body is not None:
+            return with_validators(Response(body, mimetype='text/html'), etag, last_modified)
+
     page = request.args.get('page', 1, type=int)
     sort_by = request.args.get('sort_by', 'purchase_date', type=str)
     sort_order = request.args.get('sort_order', 'desc', type=str)  # от я до а
@@ -130,48 +493,53 @@ def index():
     date_from = request.args.get('date_from', None, type=str)
     date_to = request.args.get('date_to', None, type=str)
 
-    per_page = 10
+    per_page = app.config['PER_PAGE']
 
-    query = Equipment.query
+    key = sort_key(sort_by, category_filter, status_filter)
+    # Категория и миниатюра фото нужны в каждой строке таблицы - грузим их вместе с оборудованием, а не отдельным запросом на строку
+    query = filter_equipment(equipment_list_query(key).options(joinedload(Equipment.photo)),
+                             category_filter, status_filter, date_from, date_to)
 
-    if category_filter:
-        query = query.filter(Equipment.category_id == category_filter)
-    if status_filter:
-        query = query.filter(Equipment.status == status_filter)
+    after = request.args.get('after', None, type=str)
+    before = request.args.get('before', None, type=str)
+    keyset = app.config['PAGINATION_MODE'] == 'keyset' or bool(after or before)
 
-    if date_from:
-        date_from_dt = datetime.strptime(date_from, '%Y-%m-%d')
-        query = query.filter(Equipment.purchase_date >= date_from_dt)
-    if date_to:
-        date_to_dt = datetime.strptime(date_to, '%Y-%m-%d')
-        query = query.filter(Equipment.purchase_date <= date_to_dt)
-
-    if sort_by == 'category':
-        sort_column = Equipment.category.has(name=Category.name)
-    elif sort_by == 'status':
-        sort_column = Equipment.status
-    elif sort_by == 'purchase_date':
-        sort_column = Equipment.purchase_date
-    else:
-        sort_column = Equipment.purchase_date
+    signature = filter_signature(category_filter, status_filter, date_from, date_to)
+    total_is_estimate = False
 
-    if sort_order == 'asc':
-        query = query.order_by(sort_column.asc())
+    if keyset:
+        # Курсорная пагинация: страница N стоит столько же, сколько первая
+        pagination = keyset_paginate(query, key,
+                                     descending=sort_order != 'asc',
+                                     per_page=per_page,
+                                     after=decode_cursor(after, key) if after else None,
+                                     before=decode_cursor(before, key) if before else None)
     else:
-        query = query.order_by(sort_column.desc())
-
-    # Paginate
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        query = order_equipment(query, key, descending=sort_order != 'asc')
+
+        # Paginate: число строк берём из кэша по сигнатуре фильтра, а не отдельным COUNT(*) на каждый клик
+        pagination = query.paginate(page=page, per_page=per_page, max_per_page=None, error_out=False, count=False)
+        total, total_is_estimate = count_equipment(signature)
+        if total_is_estimate:
+            # Точного числа нет - оставляем ссылку вперёд, пока текущая страница заполнена целиком
+            seen = (pagination.page - 1) * per_page + len(pagination.items)
+            total = max(total, seen + (1 if len(pagination.items) == per_page else 0))
+        pagination.total = total
     equipments = pagination.items
 
-    categories = Category.query.all()
+    categories = category_cache.get()
     statuses = ['В эксплуатации', 'На ремонте', 'Списано']
+    category_counts, status_counts = facet_counts(signature)
 
-    return render_template('index.html',
+    html = render_template('index.html',
                            equipments=equipments,
                            pagination=pagination,
+                           keyset=keyset,
+                           total_is_estimate=total_is_estimate,
                            categories=categories,
                            statuses=statuses,
+                           category_counts=category_counts,
+                           status_counts=status_counts,
                            sort_by=sort_by,
                            sort_order=sort_order,
                            category_filter=category_filter,
@@ -179,49 +547,325 @@ def index():
                            date_from=date_from,
                            date_to=date_to
                            )
+    if app.config['PAGE_CACHE_MAX_BYTES']:
+        page_cache.set(cache_key, html.encode('utf-8'))
+    return with_validators(Response(html, mimetype='text/html'), etag, last_modified)
+
+
+@app.cli.command('check-query-budget')
+@click.option('--budget', default=5, show_default=True, help='Максимум SQL-запросов на одну страницу списка.')
+def check_query_budget(budget):
+    """Проверяет, что страница списка укладывается в фиксированное число SQL-запросов при любом размере страницы."""
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    # По одному пользователю на роль плюс анонимный посетитель
+    engine = db.engine
+    users = [(None, 'anonymous')]
+    for role in Role.query.all():
+        user = User.query.filter_by(role_id=role.id).first()
+        if user is not None:
+            users.append((user.id, user.username))
+
+    client = app.test_client()
+    failed = False
+    event.listen(engine, 'before_cursor_execute', count_statement)
+    try:
+        for mode in ('offset', 'keyset'):
+            for per_page in (1, 10, 50, 200):
+                for user_id, username in users:
+                    app.config['PAGINATION_MODE'] = mode
+                    app.config['PER_PAGE'] = per_page
+                    with client.session_transaction() as session:
+                        session.clear()
+                        if user_id is not None:
+                            session['_user_id'] = str(user_id)
+                            session['_fresh'] = True
+                    statements.clear()
+                    # Меряем худший случай - отрисовку с холодными кэшами
+                    invalidate_local_caches()
+                    category_cache.invalidate()
+                    # Свежий контекст приложения - своя сессия БД и свой g, как у настоящего запроса
+                    with app.app_context():
+                        response = client.get('/')
+                    ok = response.status_code == 200 and len(statements) <= budget
+                    failed = failed or not ok
+                    click.echo(f"{'OK  ' if ok else 'FAIL'} mode={mode} per_page={per_page} user={username}: "
+                               f"{len(statements)} запросов, HTTP {response.status_code}")
+    finally:
+        event.remove(engine, 'before_cursor_execute', count_statement)
+
+    if failed:
+        raise click.ClickException(f'Превышен бюджет в {budget} SQL-запросов на страницу списка')
+
+
+@app.cli.command('check-query-plans')
+def check_query_plans():
+    """Прогоняет EXPLAIN QUERY PLAN для всех сочетаний фильтров и сортировок списка и падает на полном скане equipment."""
+    if db.engine.dialect.name != 'sqlite':
+        raise click.ClickException('Проверка планов поддерживает только SQLite (EXPLAIN QUERY PLAN)')
+
+    # Полный проход по equipment: либо скан таблицы, либо скан всего индекса с последующей сортировкой в памяти
+    full_scan = re.compile(r'^SCAN (TABLE )?equipment\b(?! USING)')
+    full_sort = re.compile(r'^USE TEMP B-TREE FOR ORDER BY')
+    category = Category.query.first()
+    filters = {
+        'category': [None, category.id if category else 1],
+        'status': [None, 'На ремонте'],
+        'dates': [(None, None), ('2020-01-01', None), ('2020-01-01', '2024-12-31')],
+    }
+    failed = 0
+
+    for category_filter, status_filter, (date_from, date_to), sort_by, descending, mode in itertools.product(
+            filters['category'], filters['status'], filters['dates'], SORT_COLUMNS, (True, False), ('offset', 'keyset')):
+        key = sort_key(sort_by, category_filter, status_filter)
+        query = filter_equipment(equipment_list_query(key).options(joinedload(Equipment.photo)),
+                                 category_filter, status_filter, date_from, date_to)
+        if mode == 'keyset':
+            # Курсор берём с настоящей строки выборки, чтобы планировщик видел правдоподобные значения
+            first = order_equipment(query, key, descending).first()
+            if first is not None:
+                sample = key_values(first, key)
+            else:
+                sample = tuple(date(2022, 1, 1) if column.type.python_type is date else
+                               1 if column.type.python_type is int else '' for column, _ in key)
+            query = keyset_query(query, key, descending, cursor=sample)
+        else:
+            query = order_equipment(query, key, descending).offset(100)
+        sql = query.limit(app.config['PER_PAGE']).statement.compile(
+            dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+        plan = [row[-1] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+
+        scans = any(step.startswith('SCAN equipment') for step in plan)
+        bad = any(full_scan.search(step) for step in plan) or (scans and any(full_sort.search(step) for step in plan))
+        failed += bad
+        click.echo(f"{'FAIL' if bad else 'OK  '} category={category_filter} status={status_filter} "
+                   f"dates={date_from}..{date_to} sort={sort_by} {'desc' if descending else 'asc'} mode={mode}")
+        for step in plan:
+            click.echo(f'       {step}')
+
+    if failed:
+        raise click.ClickException(f'Полный скан таблицы equipment в {failed} сочетаниях фильтров и сортировки')
+
+
+@app.route('/cache_stats')
+@login_required
+@role_required('admin')
+def cache_stats():
+    return jsonify({
+        'categories': category_cache.stats(),
+        'pages': {'hits': page_cache.hits, 'misses': page_cache.misses, 'bytes': page_cache.size},
+        'resized': resized_cache.stats(),
+    })
+
+
+def save_uploaded_photo(file):
+    """Сохраняет загруженное фото и возвращает его Photo (новую запись или уже существующую).
+
+    Поток за один проход хешируется и пишется в хранилище по содержимому; файл с тем же
+    MD5 там уже лежит по тому же пути, поэтому повторная загрузка не пишет его второй раз.
+    Файл с EXIF/XMP переписывается без них (см. normalize_photo), и поиск дубля повторяется
+    по MD5 очищенного файла. Уменьшенные копии делаются сразу, а варианты в MODERN_FORMATS -
+    в фоне после коммита (schedule_format_variants): AVIF большого фото кодируется секундами.
+    """
+    key, md5_hash = photo_store.put_stream(file.stream, os.path.splitext(file.filename)[1])
+    photo = Photo.query.filter_by(md5_hash=md5_hash).first()
+    if photo is None:
+        metadata = normalize_photo(key)
+        if metadata.get('md5_hash', md5_hash) != md5_hash:
+            photo = Photo.query.filter_by(md5_hash=metadata['md5_hash']).first()
+    if photo is None:
+        photo = Photo(**dict({'filename': key, 'mime_type': file.mimetype, 'md5_hash': md5_hash}, **metadata))
+        make_thumbnails(photo)
+        db.session.add(photo)
+        db.session.info.setdefault('pending_variants', []).append(photo)
+    return photo
+
+
+# Ключи image.info с метаданными, которые Pillow может перенести в сохраняемый файл
+IMAGE_METADATA_KEYS = ('exif', 'xmp', 'XML:com.adobe.xmp', 'comment')
+
+
+def has_image_metadata(image):
+    return bool(image.getexif()) or any(name in image.info for name in IMAGE_METADATA_KEYS)
+
+
+def image_format(image):
+    """Формат файла для хранения и отдачи: MPO (JPEG с доп. кадрами, так снимают многие телефоны) считаем JPEG."""
+    return 'JPEG' if image.format == 'MPO' else image.format
+
+
+def read_photo_metadata(image, path):
+    """Поля Photo, которые можно узнать из открытого изображения: размеры после поворота по EXIF, размер файла, mimetype."""
+    width, height = image.size
+    # Ориентации 5-8 поворачивают изображение на 90 градусов
+    if image.getexif().get(ExifTags.Base.Orientation, 1) in (5, 6, 7, 8):
+        width, height = height, width
+    return {'width': width, 'height': height, 'byte_size': os.path.getsize(path),
+            'mime_type': Image.MIME.get(image_format(image), 'application/octet-stream'),
+            'exif_stripped': not has_image_metadata(image)}
+
+
+def normalize_photo(key):
+    """Переписывает загруженный файл без EXIF/XMP и комментариев, применив поворот из EXIF к пикселям.
+
+    Возвращает поля для Photo (размеры, byte_size, mime_type, exif_stripped), а если файл
+    переписан - ещё filename и md5_hash очищенной копии. Исходный файл без записи Photo
+    удалит gc-photos. Анимированные и нечитаемые файлы остаются как есть. MPO Pillow открывает как
+    анимацию, но это фото: от него остаётся основной кадр в обычном JPEG - у доп. кадров свой EXIF.
+    """
+    path = photo_store.path(key)
+    try:
+        with Image.open(path) as image:
+            metadata = read_photo_metadata(image, path)
+            mpo = image.format == 'MPO'
+            if not mpo and (metadata['exif_stripped'] or getattr(image, 'is_animated', False)):
+                return metadata
+            fmt, icc_profile = image_format(image), image.info.get('icc_profile')
+            image = ImageOps.exif_transpose(image)
+            # Комментарий JPEG/GIF Pillow берёт из image.info и при сохранении, поэтому метаданные убираем
+            # оттуда; остальное (прозрачность, цветовой профиль) остаётся
+            for name in IMAGE_METADATA_KEYS:
+                image.info.pop(name, None)
+            buffer = io.BytesIO()
+            image.save(buffer, fmt, icc_profile=icc_profile, **({'quality': 95} if fmt == 'JPEG' else {}))
+        # Флаг берём из записанного файла, а не из предположения, что метаданных в нём не осталось
+        buffer.seek(0)
+        with Image.open(buffer) as written:
+            exif_stripped = not has_image_metadata(written)
+    except OSError:
+        app.logger.warning('Не удалось прочитать фото %s', key, exc_info=True)
+        return {}
+
+    buffer.seek(0)
+    filename, md5_hash = photo_store.put_stream(buffer, os.path.splitext(key)[1])
+    return dict(metadata, filename=filename, md5_hash=md5_hash, byte_size=buffer.getbuffer().nbytes,
+                exif_stripped=exif_stripped)
+
+
+def make_thumbnails(photo):
+    """Создаёт уменьшенные копии фото по THUMBNAIL_SIZES рядом с оригиналом и записывает их в photo.thumbnails.
+
+    Копии с прозрачностью сохраняются в PNG, остальные в JPEG. Если файл не читается как
+    изображение, копий нет и страницы показывают оригинал.
+    """
+    thumbnails = {}
+    sizes = app.config['THUMBNAIL_SIZES']
+    try:
+        with Image.open(photo_store.path(photo.filename)) as original:
+            # JPEG сразу декодируется в уменьшенном масштабе, не меньше самой большой копии
+            original.draft('RGB', (max(sizes), max(sizes)))
+            original = ImageOps.exif_transpose(original)
+            has_alpha = original.mode in ('RGBA', 'LA') or 'transparency' in original.info
+            if has_alpha:
+                original = original.convert('RGBA')
+                # Альфа-канал без прозрачных точек (частый случай у PNG) не мешает сохранить в JPEG
+                has_alpha = original.getchannel('A').getextrema()[0] < 255
+            original = original if has_alpha else original.convert('RGB')
+            fmt, ext = ('PNG', '.png') if has_alpha else ('JPEG', '.jpg')
+            for size in sizes:
+                if max(original.size) <= size:
+                    # Оригинал и так не больше копии - отдаём его самого
+                    thumbnails[str(size)] = photo.filename
+                    continue
+                image = original.copy()
+                image.thumbnail((size, size), Image.LANCZOS)
+                key = PhotoStore.variant_key(photo.filename, f'w{size}', ext)
+                photo_store.write(key, lambda f: image.save(f, fmt, optimize=True, quality=85))
+                thumbnails[str(size)] = key
+    except OSError:
+        app.logger.warning('Не удалось сделать уменьшенные копии фото %s', photo.filename, exc_info=True)
+        return
+    photo.thumbnails = thumbnails
+
+
+Image.init()
+# Современные форматы для вариантов фото: (расширение, mimetype, формат Pillow, параметры сохранения)
+MODERN_FORMATS = [fmt for fmt in (('avif', 'image/avif', 'AVIF', {'quality': 60}),
+                                  ('webp', 'image/webp', 'WEBP', {'quality': 80, 'method': 4}))
+                  if fmt[0] in app.config['IMAGE_FORMATS'] and fmt[2] in Image.SAVE]
+
+
+def make_format_variants(photo):
+    """Создаёт для оригинала и каждой уменьшенной копии файлы в MODERN_FORMATS рядом с ними (<ключ>.webp и т.п.).
+
+    Вариант сохраняется, только если он меньше исходного файла, - иначе show_image просто отдаёт исходный.
+    """
+    for key in {photo.filename, *(photo.thumbnails or {}).values()}:
+        source = photo_store.path(key)
+        try:
+            with Image.open(source) as image:
+                image = ImageOps.exif_transpose(image)
+                has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+                image = image.convert('RGBA' if has_alpha else 'RGB')
+                for ext, _, pil_format, options in MODERN_FORMATS:
+                    buffer = io.BytesIO()
+                    image.save(buffer, pil_format, **options)
+                    if buffer.tell() < os.path.getsize(source):
+                        photo_store.write(f'{key}.{ext}', lambda f: f.write(buffer.getbuffer()))
+        except OSError:
+            app.logger.warning('Не удалось сделать варианты фото %s в других форматах', key, exc_info=True)
+            return
+    photo.formats = [ext for ext, *_ in MODERN_FORMATS]
+
+
+# Варианты новых фото делаются по одному в фоне: тяжёлое кодирование не занимает обработчики запросов.
+# Пока вариантов нет, show_image отдаёт оригинал; если процесс завершится раньше, их доделает make-thumbnails
+variant_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='photo-variants')
+
+
+def run_format_variants(photo_id):
+    with app.app_context():
+        try:
+            photo = db.session.get(Photo, photo_id)
+            if photo is not None:
+                make_format_variants(photo)
+                db.session.commit()
+        except Exception:
+            app.logger.exception('Не удалось сделать варианты фото %s в других форматах', photo_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def schedule_format_variants(session):
+    for photo in session.info.pop('pending_variants', ()):
+        # id известен и у объекта, истёкшего после коммита; без identity строка так и не была записана
+        identity = inspect(photo).identity
+        if identity is not None and MODERN_FORMATS:
+            variant_executor.submit(run_format_variants, identity[0])
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_pending_variants(session):
+    session.info.pop('pending_variants', None)
 
 
 @app.route('/add', methods=['GET', 'POST'])
 @login_required
 @role_required('admin')
 def add_equipment():
-    if current_user.role != 'admin':
-        flash('У вас недостаточно прав для выполнения данного действия', 'danger')
-        return redirect(url_for('index'))
-
     form = EquipmentForm()
-    form.category_id.choices = [(c.id, c.name) for c in Category.query.all()]
-    form.photo_id.choices = [(p.id, p.filename) for p in Photo.query.all()]
+    form.category_id.choices = category_cache.get()
 
     if form.validate_on_submit():
-        photo_id = None
-
-        if form.new_photo.data:
-            file = form.new_photo.data
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                new_photo = Photo(filename=filename, mime_type=file.mimetype,
-                                  md5_hash='a09f3c477f097c052bc1e6d148842df3')
-                db.session.add(new_photo)
-                db.session.commit()
-                photo_id = new_photo.id
-        else:
-            photo_id = form.photo_id.data
-
         equipment = Equipment(name=form.name.data,
                               inventory_number=form.inventory_number.data,
                               category_id=form.category_id.data,
                               purchase_date=form.purchase_date.data,
                               cost=form.cost.data,
-                              status=form.status.data,
-                              photo_id=photo_id)
+                              status=form.status.data)
+        photo_file = uploaded_file(form.photo)
+        if photo_file:
+            equipment.photo = save_uploaded_photo(photo_file)
 
         db.session.add(equipment)
         db.session.commit()
         flash('Оборудование успешно добавлено!', 'success')
         return redirect(url_for('index'))
 
+    return render_template('add.html', form=form)
+
 
 @app.route('/delete/<int:equipment_id>', methods=['POST'])
 @login_required
@@ -242,8 +886,13 @@ def equipment_delete(equipment_id):
 @login_required
 @role_required('admin')
 def equipment_detail(equipment_id):
+    etag, last_modified = make_etag('equipment', equipment_id, current_user.role.name), data_version.last_modified()
+    if not_modified(etag, last_modified):
+        return with_validators(Response(status=304), etag, last_modified)
+
     equipment = Equipment.query.get_or_404(equipment_id)
-    return render_template('equipment_detail.html', equipment=equipment)
+    html = render_template('equipment_detail.html', equipment=equipment)
+    return with_validators(Response(html, mimetype='text/html'), etag, last_modified)
 
 
 @app.route('/equipment/<int:equipment_id>/add_maintenance_log', methods=['POST'])
@@ -305,7 +954,7 @@ def edit_equipment(id):
     
     equipment = Equipment.query.get_or_404(id)
     form = EquipmentForm(obj=equipment)
-    form.category_id.choices = [(c.id, c.name) for c in Category.query.all()]
+    form.category_id.choices = category_cache.get()
 
     if form.validate_on_submit():
         equipment.name = form.name.data
@@ -315,36 +964,10 @@ def edit_equipment(id):
         equipment.cost = form.cost.data
         equipment.status = form.status.data
 
-        if form.photo.data:  # Проверяем, был ли загружен файл
-            file = form.photo.data
-            filename = secure_filename(file.filename)
-            # Генерируем уникальное имя файла
-            timestamp = int(datetime.now().timestamp())
-            new_filename = f"{timestamp}_{filename}"
-            filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], new_filename)
-            # Вычисляем MD5-хеш
-            md5_hash = generate_md5(filepath)
-            # Проверяем, существует ли уже файл с таким хешем
-            existing_photo = Photo.query.filter_by(md5_hash=md5_hash).first()
-            if existing_photo:
-
-                equipment.photo_id = existing_photo.id
-                try: 
-                    os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], equipment.photo))
-                except:
-                    pass
-            else:
-                file.save(filepath)
-                photo = Photo(filename=new_filename, mime_type=file.mimetype, md5_hash=md5_hash)
-                db.session.add(photo)
-                db.session.commit()
-
-                equipment.photo_id = photo.id
-                try:
-                    os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], equipment.photo))
-                except:
-                    pass
-            equipment.photo = new_filename
+        photo_file = uploaded_file(form.photo)
+        if photo_file:
+            # Старый файл не удаляем: то же фото может быть у другого оборудования
+            equipment.photo = save_uploaded_photo(photo_file)
 
         db.session.commit()
         flash('Оборудование успешно обновлено!', 'success')
@@ -353,50 +976,928 @@ def edit_equipment(id):
     return render_template('edit.html', form=form, equipment=equipment)
 
 
-@app.route('/uploads/<filename>')
-def show_image(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+def accepts_explicitly(mimetype):
+    """Клиент явно назвал mimetype в Accept (*/* и image/* не в счёт: их шлют и браузеры без WebP/AVIF)."""
+    return any(value == mimetype and quality > 0 for value, quality in request.accept_mimetypes)
 
 
-def export_equipment_to_xml():
-    equipment_list = Equipment.query.all()
+def send_immutable(path, mimetype, etag, accel_path=None):
+    """Отдаёт файл, содержимое которого по этому адресу не меняется: сильный ETag и долгий immutable-кэш.
 
-    root = Element('EquipmentList')
-    for equipment in equipment_list:
-        equipment_element = SubElement(root, 'Equipment')
+    В режиме PHOTO_SEND_MODE передачу байтов берёт на себя фронт-прокси (X-Accel-Redirect - только для
+    файлов с accel_path, X-Sendfile - для любых), иначе файл отдаёт Flask с поддержкой Range.
+    """
+    mode = app.config['PHOTO_SEND_MODE']
+    if mode == 'x-accel-redirect' and accel_path is not None:
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = accel_path
+    elif mode == 'x-sendfile':
+        response = Response(mimetype=mimetype)
+        response.headers['X-Sendfile'] = os.path.abspath(path)
+    else:
+        response = send_file(path, mimetype=mimetype, etag=etag, conditional=True)
+    if mode is not None and response.status_code == 200:
+        # Тело отдаёт прокси, а на повторный запрос с тем же ETag отвечаем 304 сами
+        response.set_etag(etag)
+        response.make_conditional(request)
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config['PHOTO_MAX_AGE']
+    response.cache_control.immutable = True
+    return response
 
-        name = SubElement(equipment_element, 'Name')
-        name.text = equipment.name
 
-        inventory_number = SubElement(equipment_element, 'InventoryNumber')
-        inventory_number.text = equipment.inventory_number
+@app.route('/uploads/<path:filename>')
+def show_image(filename):
+    if not PhotoStore.KEY.fullmatch(filename) or not photo_store.exists(filename):
+        abort(404)
+    # Один адрес для всех клиентов: самый лёгкий из вариантов, которые клиент понимает
+    variants = []
+    for ext, mimetype, _, _ in MODERN_FORMATS:
+        if accepts_explicitly(mimetype):
+            try:
+                variants.append((os.path.getsize(photo_store.path(f'{filename}.{ext}')), ext, mimetype))
+            except FileNotFoundError:
+                pass
+    if variants:
+        _, ext, mimetype = min(variants)
+        filename = f'{filename}.{ext}'
+    else:
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    # Ключ начинается с Photo.md5_hash оригинала, а суффикс различает копии и форматы
+    response = send_immutable(photo_store.path(filename), mimetype, filename.rsplit('/', 1)[1],
+                              accel_path=app.config['PHOTO_ACCEL_PREFIX'] + filename)
+    response.vary.add('Accept')
+    return response
 
-        category = SubElement(equipment_element, 'Category')
-        category.text = equipment.category.name
 
-        purchase_date = SubElement(equipment_element, 'PurchaseDate')
-        purchase_date.text = equipment.purchase_date.strftime('%Y-%m-%d')
+@app.cli.command('make-thumbnails')
+@click.option('--all', 'rebuild_all', is_flag=True, help='Пересоздать копии и у фото, где они уже есть.')
+def make_thumbnails_command(rebuild_all):
+    """Создаёт уменьшенные копии и варианты в современных форматах для фото, загруженных до их появления
+    (или после смены THUMBNAIL_SIZES / IMAGE_FORMATS)."""
+    sizes = {str(size) for size in app.config['THUMBNAIL_SIZES']}
+    formats = [ext for ext, *_ in MODERN_FORMATS]
+    done = 0
+    for photo in Photo.query.order_by(Photo.id):
+        if rebuild_all or set(photo.thumbnails or {}) != sizes or photo.formats != formats:
+            make_thumbnails(photo)
+            make_format_variants(photo)
+            done += 1
+    db.session.commit()
+    click.echo(f'Обработано фото: {done}')
 
-        cost = SubElement(equipment_element, 'Cost')
-        cost.text = str(equipment.cost)
 
-        status = SubElement(equipment_element, 'Status')
-        status.text = equipment.status
+def file_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
 
-    xml_string = tostring(root, 'utf-8')
-    dom = minidom.parseString(xml_string)
-    pretty_xml_string = dom.toprettyxml()
 
-    return pretty_xml_string
+def collect_orphan_photos(grace, batch_size, dry_run=False, log=None):
+    """Удаляет фото, на которые не ссылается оборудование, и файлы хранилища без записей Photo.
+
+    Строки Photo без ссылок выбираются пачками по batch_size (NOT EXISTS по ix_equipment_photo_id)
+    и удаляются пачкой в своей транзакции. Затем файлы хранилища, MD5 которых не осталось ни у одной
+    строки, удаляются вместе с копиями и вариантами. Всё, что моложе grace секунд (по mtime файла),
+    не трогается. dry_run только считает; log(сообщение) получает каждый найденный объект.
+    """
+    log = log or (lambda message: None)
+    cutoff = time.time() - grace
+    report = {'rows': 0, 'files': 0, 'bytes': 0, 'dry_run': dry_run}
+
+    removed_ids = set()
+    last_id = 0
+    while True:
+        batch = (db.session.query(Photo.id, Photo.filename)
+                 .filter(Photo.id > last_id, ~exists().where(Equipment.photo_id == Photo.id))
+                 .order_by(Photo.id).limit(batch_size).all())
+        if not batch:
+            break
+        last_id = batch[-1].id
+        # Нет файла - нет и смысла ждать
+        orphans = [row for row in batch if (file_mtime(photo_store.path(row.filename)) or 0) < cutoff]
+        for row in orphans:
+            log(f'фото {row.id}: {row.filename}')
+        if dry_run:
+            # Строки остаются в БД - при поиске файлов без записей считаем их уже удалёнными
+            removed_ids.update(row.id for row in orphans)
+            report['rows'] += len(orphans)
+        elif orphans:
+            # Загрузка, попавшая на тот же файл, обновляет его mtime до того, как найдёт эту строку Photo:
+            # такие строки пропускаем. Ссылку могли добавить, пока шла проверка, поэтому условие
+            # повторяется в самом DELETE
+            stale_ids = [row.id for row in orphans if (file_mtime(photo_store.path(row.filename)) or 0) < cutoff]
+            report['rows'] += (db.session.query(Photo)
+                               .filter(Photo.id.in_(stale_ids), ~exists().where(Equipment.photo_id == Photo.id))
+                               .delete(synchronize_session=False))
+            mark_data_changed(db.session, Photo)
+            db.session.commit()
+
+    # Имя файла хранилища - MD5 из ключа (Photo.filename), а не Photo.md5_hash: они расходятся
+    # у строк, которые verify-photos показывает как «ДРУГОЙ MD5»
+    known = {filename.rsplit('/', 1)[-1][:32] for photo_id, filename in db.session.query(Photo.id, Photo.filename)
+             if photo_id not in removed_ids}
+    for entry in itertools.chain(photo_store.scan(), photo_store.scan_tmp()):
+        stat = entry.stat()
+        if entry.name[:32] in known or stat.st_mtime >= cutoff:
+            continue
+        log(f'файл {os.path.relpath(entry.path, photo_store.root)} ({stat.st_size} байт)')
+        report['files'] += 1
+        report['bytes'] += stat.st_size
+        if not dry_run:
+            # Файл могли переиспользовать новой загрузкой после обхода - тогда его mtime обновлён
+            if (file_mtime(entry.path) or cutoff) < cutoff:
+                os.remove(entry.path)
+    return report
+
+
+@app.cli.command('gc-photos')
+@click.option('--dry-run', is_flag=True, help='Только показать, что будет удалено.')
+@click.option('--grace', type=int, default=None, help='Не трогать фото моложе стольких секунд (по умолчанию PHOTO_GC_GRACE).')
+@click.option('--batch-size', type=int, default=500, show_default=True)
+def gc_photos_command(dry_run, grace, batch_size):
+    """Удаляет фото без ссылок из оборудования и файлы хранилища без записей Photo."""
+    grace = app.config['PHOTO_GC_GRACE'] if grace is None else grace
+    report = collect_orphan_photos(grace, batch_size, dry_run=dry_run, log=click.echo if dry_run else None)
+    click.echo(f"{'Будет удалено' if dry_run else 'Удалено'}: записей Photo {report['rows']}, "
+               f"файлов {report['files']} ({report['bytes'] / 1024 / 1024:.1f} МБ)")
+
+
+@app.cli.command('verify-photos')
+@click.option('--workers', type=int, default=None, help='Число процессов (по умолчанию - по числу ядер).')
+@click.option('--rehash', is_flag=True, help='Записать пересчитанный MD5 в Photo.md5_hash, где он расходится с файлом.')
+def verify_photos_command(workers, rehash):
+    """Проверяет файлы всех фото: MD5 считается параллельно в пуле процессов.
+
+    Отсутствующий файл и файл хранилища, содержимое которого не совпадает с MD5 в его имени,
+    считаются ошибкой. Расхождение с Photo.md5_hash у целого файла (старые записи) исправляется
+    с --rehash.
+    """
+    rows = db.session.query(Photo.id, Photo.filename, Photo.md5_hash).order_by(Photo.id).all()
+    missing, corrupt, stale = [], [], []
+    total_bytes = 0
+    started = last_report = time.monotonic()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(file_md5, [photo_store.path(row.filename) for row in rows], chunksize=16)
+        for done, (row, (md5_hash, size)) in enumerate(zip(rows, results), 1):
+            if md5_hash is None:
+                missing.append(row)
+                click.echo(f'НЕТ ФАЙЛА  фото {row.id}: {row.filename}')
+            elif PhotoStore.KEY.fullmatch(row.filename) and md5_hash != row.filename.rsplit('/', 1)[1][:32]:
+                corrupt.append(row)
+                click.echo(f'ПОВРЕЖДЁН  фото {row.id}: {row.filename} (MD5 {md5_hash})')
+            elif md5_hash != row.md5_hash:
+                stale.append({'id': row.id, 'md5_hash': md5_hash})
+                click.echo(f'ДРУГОЙ MD5 фото {row.id}: в БД {row.md5_hash}, у файла {md5_hash}')
+            total_bytes += size or 0
+
+            now = time.monotonic()
+            if now - last_report >= 2 or done == len(rows):
+                last_report = now
+                elapsed = max(now - started, 1e-6)
+                click.echo(f'  {done}/{len(rows)} файлов, {total_bytes / 1024 / 1024:.1f} МБ, '
+                           f'{done / elapsed:.0f} файлов/с, {total_bytes / 1024 / 1024 / elapsed:.1f} МБ/с')
+
+    if rehash and stale:
+        db.session.execute(update(Photo), stale)
+        mark_data_changed(db.session, Photo)
+        db.session.commit()
+    click.echo(f'Проверено {len(rows)} фото за {time.monotonic() - started:.1f} с: нет файла {len(missing)}, '
+               f'повреждено {len(corrupt)}, другой MD5 {len(stale)}{" (исправлено)" if rehash and stale else ""}')
+    if missing or corrupt:
+        raise click.ClickException('Хранилище фото не прошло проверку')
+
+
+@app.cli.command('backfill-photo-metadata')
+@click.option('--batch-size', type=int, default=200, show_default=True)
+def backfill_photo_metadata_command(batch_size):
+    """Заполняет размеры, byte_size, mime_type и exif_stripped у фото, загруженных до появления этих полей.
+
+    Файлы только читаются (Pillow разбирает заголовок, не декодируя пиксели); каждая пачка
+    записывается одним UPDATE в своей транзакции.
+    """
+    done = failed = 0
+    last_id = 0
+    while True:
+        batch = (db.session.query(Photo.id, Photo.filename).filter(Photo.id > last_id, Photo.width.is_(None))
+                 .order_by(Photo.id).limit(batch_size).all())
+        if not batch:
+            break
+        last_id = batch[-1].id
+        values = []
+        for row in batch:
+            path = photo_store.path(row.filename)
+            try:
+                with Image.open(path) as image:
+                    values.append(dict(read_photo_metadata(image, path), id=row.id))
+            except OSError as e:
+                failed += 1
+                click.echo(f'фото {row.id}: {row.filename}: {e}')
+        if values:
+            db.session.execute(update(Photo), values)
+            mark_data_changed(db.session, Photo)
+        db.session.commit()
+        done += len(values)
+        click.echo(f'  заполнено {done}, ошибок {failed}')
+    click.echo(f'Готово: заполнено {done}, ошибок {failed}')
+
+
+# Pillow отпускает GIL на декодировании и ресайзе, так что потоков достаточно; пул ограничивает
+# одновременную тяжёлую работу, а не число запросов
+resize_executor = ThreadPoolExecutor(max_workers=app.config['RESIZE_WORKERS'], thread_name_prefix='resize')
+RESIZE_MIMETYPES = {'jpeg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'}
+
+
+def render_resized(source, path, width, height, fmt):
+    """Вписывает изображение в width x height (без увеличения) и сохраняет в формате fmt."""
+    with Image.open(source) as image:
+        # Квадрат по большей заданной стороне: подходит при любом повороте из EXIF
+        side = max(width or 0, height or 0)
+        image.draft('RGB', (side, side))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((width or image.width, height or image.height), Image.LANCZOS)
+        if fmt == 'jpeg':
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        image.save(path, fmt.upper(), quality=85, optimize=True)
+
+
+@app.route('/resize/<path:filename>')
+def resize_image(filename):
+    width = request.args.get('w', None, type=int)
+    height = request.args.get('h', None, type=int)
+    fmt = request.args.get('format', 'jpeg', type=str)
+    sizes = app.config['RESIZE_SIZES']
+    if (fmt not in app.config['RESIZE_FORMATS'] or (width is None and height is None)
+            or width not in (None, *sizes) or height not in (None, *sizes)):
+        abort(400)
+    if not PhotoStore.KEY.fullmatch(filename) or not photo_store.exists(filename):
+        abort(404)
+
+    source = photo_store.path(filename)
+    path = resized_cache.get(f'{filename}:{width}x{height}.{fmt}', f'.{fmt}',
+                             lambda tmp_path: resize_executor.submit(render_resized, source, tmp_path,
+                                                                     width, height, fmt).result())
+    return send_immutable(path, RESIZE_MIMETYPES[fmt], os.path.basename(path))
+
+
+# Отступы повторяют прежний вывод minidom.toprettyxml(), чтобы 1С получала тот же формат
+XML_EQUIPMENT_TEMPLATE = (
+    '\t<Equipment>\n'
+    '\t\t<Name>{name}</Name>\n'
+    '\t\t<InventoryNumber>{inventory_number}</InventoryNumber>\n'
+    '\t\t<Category>{category}</Category>\n'
+    '\t\t<PurchaseDate>{purchase_date}</PurchaseDate>\n'
+    '\t\t<Cost>{cost}</Cost>\n'
+    '\t\t<Status>{status}</Status>\n'
+    '\t</Equipment>\n'
+)
+
+
+def equipment_to_xml(equipment):
+    return XML_EQUIPMENT_TEMPLATE.format(
+        name=xml_escape(equipment.name),
+        inventory_number=xml_escape(equipment.inventory_number),
+        category=xml_escape(equipment.category.name),
+        purchase_date=equipment.purchase_date.strftime('%Y-%m-%d'),
+        cost=xml_escape(str(equipment.cost)),
+        status=xml_escape(equipment.status),
+    )
+
+
+def export_equipment_to_xml(since=None, watermark=None, progress=None):
+    """Отдаёт XML выгрузки для 1С по частям.
+
+    Строки читаются из БД пачками по EXPORT_CHUNK_SIZE вместе с категорией (один JOIN),
+    и каждая пачка сразу уходит клиенту - весь документ в памяти не собирается.
+    С since выгружаются только изменения: сначала удалённое (DeletedEquipment),
+    затем созданное и изменённое оборудование с updated_at не раньше since.
+    progress(rows), если задан, вызывается после каждой отданной пачки оборудования.
+    """
+    chunk_size = app.config['EXPORT_CHUNK_SIZE']
+    query = equipment_list_query().order_by(Equipment.id)
+    if since is not None:
+        query = query.filter(Equipment.updated_at >= since)
+
+    attributes = ''
+    if since is not None:
+        attributes += f' since="{since.isoformat()}"'
+    if watermark is not None:
+        attributes += f' watermark="{watermark.isoformat()}"'
+    chunk = [f'<?xml version="1.0" encoding="utf-8"?>\n<EquipmentList{attributes}>\n']
+
+    if since is not None:
+        deleted = (DeletedEquipment.query.filter(DeletedEquipment.deleted_at >= since)
+                   .order_by(DeletedEquipment.id).yield_per(chunk_size))
+        for tombstone in deleted:
+            chunk.append(f'\t<DeletedEquipment>\n'
+                         f'\t\t<InventoryNumber>{xml_escape(tombstone.inventory_number)}</InventoryNumber>\n'
+                         f'\t\t<DeletedAt>{tombstone.deleted_at.isoformat()}</DeletedAt>\n'
+                         f'\t</DeletedEquipment>\n')
+            if len(chunk) >= chunk_size:
+                yield ''.join(chunk)
+                chunk.clear()
+
+    rows = 0
+    for equipment in query.yield_per(chunk_size):
+        chunk.append(equipment_to_xml(equipment))
+        rows += 1
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk.clear()
+            if progress is not None:
+                progress(rows)
+    chunk.append('</EquipmentList>\n')
+    yield ''.join(chunk)
+    if progress is not None:
+        progress(rows)
+
+
+def export_watermark():
+    """Водяной знак для следующей инкрементальной выгрузки.
+
+    Берётся с запасом назад: транзакция, начатая до выгрузки, может закоммитить строку
+    с более ранним updated_at. Повтор строки 1С безвреден, пропуск - нет.
+    """
+    return datetime.utcnow() - timedelta(seconds=app.config['EXPORT_WATERMARK_LAG'])
+
+
+def build_export_artifact(path, progress=None):
+    """Собирает полную выгрузку в gzip-файл; mtime файла - его водяной знак."""
+    watermark = export_watermark()
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for chunk in export_equipment_to_xml(watermark=watermark, progress=progress):
+            f.write(chunk)
+    timestamp = watermark.replace(tzinfo=timezone.utc).timestamp()
+    os.utime(path, (timestamp, timestamp))
+
+
+def send_export_file(path):
+    """Отдаёт собранную gzip-выгрузку: как есть клиентам с gzip, иначе - распаковывая на лету."""
+    watermark = datetime.fromtimestamp(os.stat(path).st_mtime, timezone.utc).replace(tzinfo=None)
+    if request.accept_encodings['gzip']:
+        response = send_file(path, mimetype='text/xml', as_attachment=True, download_name='equipment.xml')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = send_file(gzip.open(path, 'rb'), mimetype='text/xml', as_attachment=True,
+                             download_name='equipment.xml')
+    response.vary.add('Accept-Encoding')
+    response.headers['X-Export-Watermark'] = watermark.isoformat()
+    return response
+
 
 @app.route('/export_to_1c')
 def export_to_1c():
-    xml_data = export_equipment_to_xml()
-    response =  Response(xml_data, mimetype='text/xml')
-    response.headers['Content-Disposition'] = 'attachment; filename=equipment.xml'
+    # since - водяной знак из предыдущей выгрузки: тогда отдаём только изменения после него
+    since = request.args.get('since', None, type=str)
+    if since:
+        try:
+            since = datetime.fromisoformat(since)
+        except ValueError:
+            abort(400)
+
+        watermark = export_watermark()
+        response = Response(stream_with_context(export_equipment_to_xml(since, watermark)), mimetype='text/xml')
+        response.headers['Content-Disposition'] = 'attachment; filename=equipment.xml'
+        response.headers['X-Export-Watermark'] = watermark.isoformat()
+        return response
+
+    # Полная выгрузка собирается один раз на версию данных и дальше отдаётся готовым файлом
+    return send_export_file(export_artifact.get(build_export_artifact))
+
+
+# Фоновые выгрузки: файл и состояние задания лежат в instance/export_jobs, поэтому
+# статус может отдать любой процесс gunicorn, а не только тот, что запустил задание
+EXPORT_JOB_ID = re.compile(r'[0-9a-f]{32}')
+export_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='export')
+
+
+def export_job_path(job_id, suffix):
+    return os.path.join(app.instance_path, 'export_jobs', f'{job_id}{suffix}')
 
+
+def write_export_job(state):
+    path = export_job_path(state['id'], '.json')
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def read_export_job(job_id):
+    if not EXPORT_JOB_ID.fullmatch(job_id):
+        return None
+    try:
+        with open(export_job_path(job_id, '.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def remove_old_files(directory):
+    expired = time.time() - app.config['EXPORT_JOB_RETENTION']
+    for entry in os.scandir(directory):
+        # Тот же файл может одновременно удалять параллельный запрос
+        try:
+            if entry.stat().st_mtime < expired:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def run_export_job(job_id):
+    with app.app_context():
+        state = {'id': job_id, 'status': 'running', 'rows': 0,
+                 'total': db.session.query(func.count(Equipment.id)).scalar(),
+                 'started_at': datetime.utcnow().isoformat()}
+        write_export_job(state)
+
+        def report(rows):
+            state['rows'] = rows
+            write_export_job(state)
+
+        path = export_job_path(job_id, '.xml.gz')
+        try:
+            build_export_artifact(f'{path}.tmp', progress=report)
+            os.replace(f'{path}.tmp', path)
+            state['status'] = 'done'
+        except Exception as e:
+            app.logger.exception('Фоновая выгрузка %s не удалась', job_id)
+            state.update(status='failed', error=str(e))
+        state['finished_at'] = datetime.utcnow().isoformat()
+        write_export_job(state)
+
+
+@app.route('/export_jobs', methods=['POST'])
+@login_required
+def create_export_job():
+    os.makedirs(os.path.join(app.instance_path, 'export_jobs'), exist_ok=True)
+    remove_old_files(os.path.join(app.instance_path, 'export_jobs'))
+
+    job_id = uuid.uuid4().hex
+    write_export_job({'id': job_id, 'status': 'queued', 'rows': 0, 'total': None})
+    export_executor.submit(run_export_job, job_id)
+    return jsonify({'id': job_id, 'status_url': url_for('export_job_status', job_id=job_id)}), 202
+
+
+@app.route('/export_jobs/<job_id>')
+@login_required
+def export_job_status(job_id):
+    state = read_export_job(job_id)
+    if state is None:
+        abort(404)
+    if state['status'] == 'done':
+        state['download_url'] = url_for('export_job_download', job_id=job_id)
+    return jsonify(state)
+
+
+@app.route('/export_jobs/<job_id>/download')
+@login_required
+def export_job_download(job_id):
+    state = read_export_job(job_id)
+    if state is None:
+        abort(404)
+    if state['status'] != 'done':
+        abort(409)
+    return send_export_file(export_job_path(job_id, '.xml.gz'))
+
+
+def isoformat_or_none(value):
+    return value.isoformat() if value is not None else None
+
+
+# Столбцы выгрузок CSV/NDJSON: имя -> значение для строки оборудования
+EXPORT_COLUMNS = {
+    'id': attrgetter('id'),
+    'name': attrgetter('name'),
+    'inventory_number': attrgetter('inventory_number'),
+    'category': attrgetter('category.name'),
+    'purchase_date': lambda e: e.purchase_date.isoformat(),
+    'cost': lambda e: str(e.cost),
+    'status': attrgetter('status'),
+    'photo': lambda e: e.photo.filename if e.photo else None,
+    'responsible_persons': lambda e: [person.full_name for person in e.responsible_persons],
+    'created_at': lambda e: isoformat_or_none(e.created_at),
+    'updated_at': lambda e: isoformat_or_none(e.updated_at),
+}
+
+
+def export_rows(columns, category_filter, status_filter, date_from, date_to):
+    """Отдаёт пачки строк (списков значений) выбранных столбцов; из БД читается по EXPORT_CHUNK_SIZE строк."""
+    chunk_size = app.config['EXPORT_CHUNK_SIZE']
+    query = filter_equipment(equipment_list_query(), category_filter, status_filter, date_from, date_to)
+    # Связи подгружаем только для запрошенных столбцов: фото - тем же запросом,
+    # ответственных - одним IN-запросом на пачку (selectinload работает вместе с yield_per)
+    if 'photo' in columns:
+        query = query.options(joinedload(Equipment.photo))
+    if 'responsible_persons' in columns:
+        query = query.options(selectinload(Equipment.responsible_persons))
+    getters = [EXPORT_COLUMNS[name] for name in columns]
+
+    chunk = []
+    for equipment in query.order_by(Equipment.id).yield_per(chunk_size):
+        chunk.append([get(equipment) for get in getters])
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_csv(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for chunk in rows:
+        for row in chunk:
+            writer.writerow(['; '.join(value) if isinstance(value, list) else value for value in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_ndjson(columns, rows):
+    for chunk in rows:
+        yield ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in chunk)
+
+
+EXPORT_FORMATS = {
+    'csv': (export_csv, 'text/csv'),
+    'ndjson': (export_ndjson, 'application/x-ndjson'),
+}
+
+
+@app.route('/export/<fmt>')
+@login_required
+def export_equipment(fmt):
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    columns = request.args.get('columns', None, type=str)
+    columns = columns.split(',') if columns else list(EXPORT_COLUMNS)
+    if not all(name in EXPORT_COLUMNS for name in columns):
+        abort(400)
+
+    # Те же фильтры, что и у списка оборудования. Даты разбираем до ответа: внутри потока
+    # ошибка оборвала бы уже начатый файл с кодом 200
+    try:
+        signature = filter_signature(request.args.get('category', None, type=int),
+                                     request.args.get('status', None, type=str),
+                                     request.args.get('date_from', None, type=str),
+                                     request.args.get('date_to', None, type=str))
+    except ValueError:
+        abort(400)
+    rows = export_rows(columns, *signature)
+    write, mimetype = EXPORT_FORMATS[fmt]
+    response = Response(stream_with_context(write(columns, rows)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=equipment.{fmt}'
     return response
 
 
+def form_validator(field, validator_type):
+    return next(v for v in getattr(EquipmentForm, field).kwargs['validators'] if isinstance(v, validator_type))
+
+
+# Ограничения полей берём из EquipmentForm и модели, чтобы импорт проверял то же, что форма и БД,
+# но без создания формы на каждую строку
+EQUIPMENT_MAX_LENGTH = {field: min(form_validator(field, Length).max, Equipment.__table__.c[field].type.length)
+                        for field in ('name', 'inventory_number')}
+EQUIPMENT_MIN_COST = Decimal(form_validator('cost', NumberRange).min)
+EQUIPMENT_MAX_COST = Decimal(10) ** (Equipment.__table__.c.cost.type.precision - Equipment.__table__.c.cost.type.scale)
+EQUIPMENT_STATUSES = tuple(value for value, _ in EquipmentForm.status.kwargs['choices']
+                           if value in Equipment.__table__.c.status.type.enums)
+# Столбцы строки импорта - те же имена, что и в выгрузке CSV
+IMPORT_COLUMNS = ('name', 'inventory_number', 'category', 'purchase_date', 'cost', 'status')
+# Поля, по которым определяется, изменилась ли строка при повторном импорте
+IMPORT_FIELDS = ('name', 'category_id', 'purchase_date', 'cost', 'status')
+
+
+def parse_import_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def parse_import_cost(value):
+    try:
+        cost = Decimal(value).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        return None
+    return cost if cost.is_finite() else None
+
+
+def validate_equipment_chunk(rows, category_ids, seen):
+    """Проверяет пачку строк импорта (словари по IMPORT_COLUMNS) целыми столбцами.
+
+    seen - инвентарные номера, уже принятые из этого файла; пополняется номерами пачки.
+    Возвращает (список (индекс, значения для записи), словарь индекс -> текст ошибки).
+    """
+    columns = {column: [(row.get(column) or '').strip() for row in rows] for column in IMPORT_COLUMNS}
+    errors = {}
+
+    def reject(indexes, message):
+        for i in indexes:
+            errors.setdefault(i, message(i))
+
+    for field, max_length in EQUIPMENT_MAX_LENGTH.items():
+        reject([i for i, value in enumerate(columns[field]) if not value or len(value) > max_length],
+               lambda i, field=field, max_length=max_length:
+               f'Поле {field} пустое или длиннее {max_length} символов')
+
+    category_id = [category_ids.get(value) for value in columns['category']]
+    reject([i for i, value in enumerate(category_id) if value is None],
+           lambda i: f'Неизвестная категория: {columns["category"][i]}')
+
+    purchase_date = [parse_import_date(value) for value in columns['purchase_date']]
+    reject([i for i, value in enumerate(purchase_date) if value is None],
+           lambda i: f'Неверная дата покупки: {columns["purchase_date"][i]}')
+
+    cost = [parse_import_cost(value) for value in columns['cost']]
+    reject([i for i, value in enumerate(cost) if value is None],
+           lambda i: f'Неверная стоимость: {columns["cost"][i]}')
+    reject([i for i, value in enumerate(cost)
+            if value is not None and not EQUIPMENT_MIN_COST <= value < EQUIPMENT_MAX_COST],
+           lambda i: f'Стоимость вне допустимого диапазона: {cost[i]}')
+
+    reject([i for i, value in enumerate(columns['status']) if value not in EQUIPMENT_STATUSES],
+           lambda i: f'Недопустимый статус: {columns["status"][i]}')
+
+    valid = []
+    for i, inventory_number in enumerate(columns['inventory_number']):
+        if i in errors:
+            continue
+        if inventory_number in seen:
+            errors[i] = 'Инвентарный номер повторяется в файле'
+            continue
+        seen.add(inventory_number)
+        valid.append((i, {'name': columns['name'][i], 'inventory_number': inventory_number,
+                          'category_id': category_id[i], 'purchase_date': purchase_date[i],
+                          'cost': cost[i], 'status': columns['status'][i]}))
+    return valid, errors
+
+
+def existing_inventory_numbers(numbers):
+    existing = set()
+    for start in range(0, len(numbers), 500):
+        existing.update(number for number, in db.session.query(Equipment.inventory_number)
+                        .filter(Equipment.inventory_number.in_(numbers[start:start + 500])))
+    return existing
+
+
+def upsert_equipment_batch(batch):
+    """Записывает пачку проверенных строк одной транзакцией: insert новых и update изменённых по inventory_number.
+
+    Возвращает (создано, обновлено, без изменений).
+    """
+    numbers = [values['inventory_number'] for values in batch]
+    existing = {}
+    for start in range(0, len(numbers), 500):
+        rows = db.session.query(Equipment.id, Equipment.inventory_number,
+                                *(getattr(Equipment, field) for field in IMPORT_FIELDS)
+                                ).filter(Equipment.inventory_number.in_(numbers[start:start + 500]))
+        existing.update((row.inventory_number, row) for row in rows)
+
+    now = datetime.utcnow()
+    inserts, updates, unchanged = [], [], 0
+    for values in batch:
+        row = existing.get(values['inventory_number'])
+        if row is None:
+            inserts.append(dict(values, created_at=now, updated_at=now))
+        elif any(getattr(row, field) != values[field] for field in IMPORT_FIELDS):
+            updates.append(dict(values, id=row.id, updated_at=now))
+        else:
+            unchanged += 1
+
+    if inserts:
+        db.session.execute(insert(Equipment), inserts)
+    if updates:
+        db.session.execute(update(Equipment), updates)
+    if inserts or updates:
+        mark_data_changed(db.session, Equipment)
+    db.session.commit()
+    return len(inserts), len(updates), unchanged
+
+
+# Теги элемента Equipment выгрузки 1С -> столбцы строки импорта
+XML_IMPORT_TAGS = {'Name': 'name', 'InventoryNumber': 'inventory_number', 'Category': 'category',
+                   'PurchaseDate': 'purchase_date', 'Cost': 'cost', 'Status': 'status'}
+
+
+def import_equipment_from_xml(source, batch_size):
+    """Загружает оборудование из XML в формате выгрузки 1С (EquipmentList).
+
+    Файл разбирается потоково (iterparse), разобранные элементы сразу освобождаются,
+    а строки проверяются и пишутся пачками по batch_size на транзакцию. Возвращает отчёт
+    с числом созданных/обновлённых строк и ошибками по номерам строк (номер элемента в файле).
+    """
+    category_ids = {category.name: category.id for category in category_cache.get()}
+    report = {'created': 0, 'updated': 0, 'unchanged': 0, 'errors': []}
+    seen = set()
+    rows, row_numbers = [], []
+    row_number = 0
+
+    def error(number, inventory_number, message):
+        report['errors'].append({'row': number, 'inventory_number': inventory_number or None, 'error': message})
+
+    def flush():
+        valid, errors = validate_equipment_chunk(rows, category_ids, seen)
+        for i, message in errors.items():
+            error(row_numbers[i], rows[i].get('inventory_number'), message)
+        if valid:
+            try:
+                created, updated, unchanged = upsert_equipment_batch([values for _, values in valid])
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                app.logger.exception('Не удалось записать пачку импорта')
+                for i, values in valid:
+                    error(row_numbers[i], values['inventory_number'], f'Ошибка записи в БД: {e.__class__.__name__}')
+            else:
+                report['created'] += created
+                report['updated'] += updated
+                report['unchanged'] += unchanged
+        rows.clear()
+        row_numbers.clear()
+
+    root = None
+    try:
+        for event_name, elem in iterparse(source, events=('start', 'end')):
+            if root is None:
+                root = elem
+            if event_name != 'end' or elem.tag not in ('Equipment', 'DeletedEquipment'):
+                continue
+            row_number += 1
+            if elem.tag == 'DeletedEquipment':
+                error(row_number, elem.findtext('InventoryNumber'), 'Удаление при импорте не поддерживается')
+            else:
+                rows.append({XML_IMPORT_TAGS[child.tag]: child.text
+                             for child in elem if child.tag in XML_IMPORT_TAGS})
+                row_numbers.append(row_number)
+            # Разобранные элементы больше не нужны - не даём дереву расти
+            root.clear()
+            if len(rows) >= batch_size:
+                flush()
+    except ParseError as e:
+        error(row_number + 1, None, f'Ошибка разбора XML: {e}')
+    if rows:
+        flush()
+    report['errors'].sort(key=lambda item: item['row'])
+    return report
+
+
+@app.route('/import_from_1c', methods=['POST'])
+@login_required
+@role_required('admin')
+def import_from_1c():
+    file = request.files.get('file')
+    if file is None:
+        abort(400)
+    return jsonify(import_equipment_from_xml(file.stream, app.config['IMPORT_BATCH_SIZE']))
+
+
+@app.cli.command('import-1c')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_1c_command(path):
+    """Загружает оборудование из XML-файла в формате выгрузки 1С."""
+    started = time.monotonic()
+    report = import_equipment_from_xml(path, app.config['IMPORT_BATCH_SIZE'])
+    click.echo(f"Создано: {report['created']}, обновлено: {report['updated']}, "
+               f"без изменений: {report['unchanged']}, ошибок: {len(report['errors'])} "
+               f"за {time.monotonic() - started:.1f} с")
+    for item in report['errors']:
+        click.echo(f"  строка {item['row']} ({item['inventory_number']}): {item['error']}")
+
+
+def import_equipment_from_csv(stream, error_stream, batch_size):
+    """Загружает новое оборудование из CSV со столбцами выгрузки (IMPORT_COLUMNS, лишние игнорируются).
+
+    Строки читаются и проверяются пачками по batch_size; инвентарные номера, уже занятые в БД
+    или повторяющиеся в файле, отклоняются. Годные строки каждой пачки вставляются одним
+    executemany в своей транзакции, отклонённые пишутся в error_stream (исходные поля + row, error).
+    Файл, который не читается (не UTF-8, битый CSV), обрабатывается до места ошибки, а её текст
+    попадает в отчёт под ключом error - как и отсутствие нужных столбцов.
+    """
+    def read_error(e):
+        hint = ' (файл должен быть в кодировке UTF-8)' if isinstance(e, UnicodeDecodeError) else ''
+        return f'Не удалось прочитать файл после строки {reader.line_num}: {e}{hint}'
+
+    reader = csv.DictReader(stream)
+    try:
+        fieldnames = reader.fieldnames or ()
+    except (UnicodeDecodeError, csv.Error) as e:
+        return {'created': 0, 'rejected': 0, 'error': read_error(e)}
+    missing = [column for column in IMPORT_COLUMNS if column not in fieldnames]
+    if missing:
+        return {'created': 0, 'rejected': 0, 'error': f'Нет столбцов: {", ".join(missing)}'}
+
+    category_ids = {category.name: category.id for category in category_cache.get()}
+    writer = csv.DictWriter(error_stream, ['row', 'error', *reader.fieldnames], extrasaction='ignore')
+    writer.writeheader()
+    report = {'created': 0, 'rejected': 0}
+    seen = set()
+    # Номер строки считаем с заголовком, как в табличном редакторе
+    row_number = 1
+    while 'error' not in report:
+        # Строки, прочитанные до ошибки декодирования или разбора, ещё обрабатываются
+        rows = []
+        try:
+            rows.extend(itertools.islice(reader, batch_size))
+        except (UnicodeDecodeError, csv.Error) as e:
+            report['error'] = read_error(e)
+        if not rows:
+            break
+        valid, errors = validate_equipment_chunk(rows, category_ids, seen)
+        taken = existing_inventory_numbers([values['inventory_number'] for _, values in valid])
+        for i, values in valid:
+            if values['inventory_number'] in taken:
+                errors[i] = 'Инвентарный номер уже есть в базе'
+        valid = [(i, values) for i, values in valid if i not in errors]
+
+        if valid:
+            now = datetime.utcnow()
+            try:
+                db.session.execute(insert(Equipment), [dict(values, created_at=now, updated_at=now)
+                                                       for _, values in valid])
+                mark_data_changed(db.session, Equipment)
+                db.session.commit()
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                app.logger.exception('Не удалось записать пачку импорта CSV')
+                errors.update((i, f'Ошибка записи в БД: {e.__class__.__name__}') for i, _ in valid)
+            else:
+                report['created'] += len(valid)
+
+        for i in sorted(errors):
+            writer.writerow(dict(rows[i], row=row_number + i + 1, error=errors[i]))
+        report['rejected'] += len(errors)
+        row_number += len(rows)
+    return report
+
+
+IMPORT_ID = EXPORT_JOB_ID
+
+
+def import_errors_path(import_id):
+    return os.path.join(app.instance_path, 'imports', f'{import_id}.errors.csv')
+
+
+@app.route('/import_csv', methods=['POST'])
+@login_required
+@role_required('admin')
+def import_csv():
+    file = request.files.get('file')
+    if file is None:
+        abort(400)
+    directory = os.path.join(app.instance_path, 'imports')
+    os.makedirs(directory, exist_ok=True)
+    remove_old_files(directory)
+
+    import_id = uuid.uuid4().hex
+    path = import_errors_path(import_id)
+    with open(path, 'w', encoding='utf-8', newline='') as error_stream:
+        report = import_equipment_from_csv(io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline=''),
+                                           error_stream, app.config['IMPORT_BATCH_SIZE'])
+    if report.get('rejected'):
+        report['errors_url'] = url_for('download_import_errors', import_id=import_id)
+    else:
+        os.remove(path)
+    # Файл не прочитан и ничего не записано - ошибка запроса; частичный импорт отдаётся с отчётом как есть
+    return jsonify(report), 400 if 'error' in report and not report['created'] else 200
+
+
+@app.route('/import_csv/<import_id>/errors')
+@login_required
+@role_required('admin')
+def download_import_errors(import_id):
+    if not IMPORT_ID.fullmatch(import_id) or not os.path.exists(import_errors_path(import_id)):
+        abort(404)
+    return send_file(import_errors_path(import_id), mimetype='text/csv', as_attachment=True,
+                     download_name='import_errors.csv')
+
+
+@app.cli.command('import-csv')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--errors', 'errors_path', default='import_errors.csv', show_default=True,
+              help='Куда записать отклонённые строки.')
+def import_csv_command(path, errors_path):
+    """Загружает новое оборудование из CSV-файла."""
+    started = time.monotonic()
+    with open(path, encoding='utf-8-sig', newline='') as stream, \
+            open(errors_path, 'w', encoding='utf-8', newline='') as error_stream:
+        report = import_equipment_from_csv(stream, error_stream, app.config['IMPORT_BATCH_SIZE'])
+    if not report.get('rejected'):
+        os.remove(errors_path)
+    click.echo(f"Создано: {report['created']}, отклонено: {report['rejected']} "
+               f"за {time.monotonic() - started:.1f} с")
+    if report['rejected']:
+        click.echo(f'Отклонённые строки: {errors_path}')
+    if 'error' in report:
+        raise click.ClickException(report['error'])
+
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,303 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timezone
+import glob
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только между потоками одного процесса
+    fcntl = None
+
+
+class DataVersion:
+    """Общая для всех процессов метка версии данных.
+
+    Метка хранится в маленьком файле и заменяется атомарно (запись во временный файл + rename)
+    при каждой записи в оборудование, категории или фото. Кэши включают её в ключ,
+    поэтому после записи в любом процессе старые записи кэша просто перестают находиться.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def current(self):
+        try:
+            with open(self.path, encoding='ascii') as f:
+                return f.read()
+        except FileNotFoundError:
+            return '0'
+
+    def last_modified(self):
+        """Время последней записи (mtime файла метки) или None, если записей ещё не было."""
+        try:
+            return datetime.fromtimestamp(os.stat(self.path).st_mtime, timezone.utc)
+        except FileNotFoundError:
+            return None
+
+    def bump(self):
+        token = f'{time.time_ns()}-{uuid.uuid4().hex[:8]}'
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # У каждого писателя свой временный файл: общий на процесс делили бы потоки, и rename одного
+        # уносил бы файл из-под другого
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='ascii') as f:
+                f.write(token)
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return token
+
+
+class CountCache:
+    """Кэш числа строк выборки по сигнатуре фильтра (в памяти процесса).
+
+    В ключ входит версия данных (DataVersion), так что после записи старые числа
+    не находятся ни в одном процессе; invalidate лишь освобождает память сразу.
+    ttl - страховка на случай записей в БД в обход приложения.
+    """
+
+    def __init__(self, ttl=60, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class PageCache:
+    """LRU-кэш отрендеренных страниц (bytes) с ограничением суммарного размера в байтах."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def set(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = body
+            self.size += len(body)
+            # Вытесняем давно не запрошенные страницы, пока не уложимся в лимит
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class VersionedValue:
+    """Значение, которое перезагружается функцией loader только при смене версии (DataVersion)."""
+
+    def __init__(self, version, loader):
+        self.version = version
+        self.loader = loader
+        self.hits = 0
+        self.misses = 0
+        self._loaded_version = None
+        self._value = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        current = self.version.current()
+        with self._lock:
+            if self._loaded_version == current:
+                self.hits += 1
+                return self._value
+            self.misses += 1
+            self._value = self.loader()
+            self._loaded_version = current
+            return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_version = None
+            self._value = None
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class FileArtifact:
+    """Файл на диске, который пересобирается только при смене версии данных.
+
+    Версия входит в имя файла, так что проверка актуальности - один stat. Пока один запрос
+    собирает новую версию, остальные ждут его и получают готовый файл: между потоками -
+    через Lock, между процессами gunicorn - через flock на файле блокировки.
+    """
+
+    def __init__(self, directory, filename_template, version):
+        self.directory = directory
+        self.filename_template = filename_template
+        self.version = version
+        self._lock = threading.Lock()
+
+    def path_for(self, token):
+        return os.path.join(self.directory, self.filename_template.format(version=token))
+
+    def get(self, build):
+        """Возвращает путь к актуальному файлу, при необходимости собрав его через build(tmp_path)."""
+        token = self.version.current()
+        path = self.path_for(token)
+        if os.path.exists(path):
+            return path
+
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, open(os.path.join(self.directory, '.lock'), 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Пока ждали блокировку, файл мог собрать другой запрос
+            if os.path.exists(path):
+                return path
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            try:
+                build(tmp_path)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            for stale in glob.glob(self.path_for('*')):
+                if stale != path:
+                    os.remove(stale)
+        return path
+
+
+class DiskLRUCache:
+    """Кэш производных файлов на диске с ограничением общего размера.
+
+    Файл ключа лежит в <directory>/ab/<sha1 ключа><суффикс>. Чтение обновляет mtime файла
+    (не чаще раза в touch_interval секунд), и при превышении max_bytes удаляются файлы
+    с самым старым mtime, пока размер не опустится до low_water от лимита. Одновременные
+    сборки одного ключа в процессе объединяются: остальные запросы ждут первый.
+    """
+
+    def __init__(self, directory, max_bytes, low_water=0.9, touch_interval=60):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, key, suffix=''):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], f'{digest}{suffix}')
+
+    def get(self, key, suffix, build):
+        """Возвращает путь к файлу ключа, при промахе собрав его через build(tmp_path)."""
+        path = self.path_for(key, suffix)
+        try:
+            if time.time() - os.stat(path).st_mtime > self.touch_interval:
+                os.utime(path)
+            self.hits += 1
+            return path
+        except FileNotFoundError:
+            pass
+
+        with self._lock:
+            future = self._building.get(path)
+            owner = future is None
+            if owner:
+                future = self._building[path] = Future()
+        if not owner:
+            return future.result()
+
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            build(tmp_path)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            with self._lock:
+                del self._building[path]
+        self.misses += 1
+        future.set_result(path)
+        self._add(size, keep=path)
+        return path
+
+    def _entries(self):
+        for shard in os.scandir(self.directory):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if not entry.name.endswith('.tmp'):
+                        stat = entry.stat()
+                        yield entry.path, stat.st_size, stat.st_mtime
+
+    def _add(self, size, keep):
+        with self._lock:
+            # Размер считается в процессе; другие процессы тоже пишут, поэтому при вытеснении он сверяется с диском
+            if self._size is None:
+                self._size = sum(entry_size for _, entry_size, _ in self._entries())
+            else:
+                self._size += size
+            if self._size <= self.max_bytes:
+                return
+            entries = sorted(self._entries(), key=lambda entry: entry[2])
+            total = sum(entry_size for _, entry_size, _ in entries)
+            for path, entry_size, _ in entries:
+                if total <= self.max_bytes * self.low_water:
+                    break
+                if path == keep:
+                    # Только что собранный файл ещё предстоит отдать
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= entry_size
+            self._size = total
+
+    def stats(self):
+        return {'size': self._size, 'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses}
@@ -7,5 +7,44 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///database.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # 'offset' - обычные номера страниц, 'keyset' - курсорная пагинация без OFFSET/COUNT(*)
+    PAGINATION_MODE = os.environ.get('PAGINATION_MODE') or 'offset'
+    PER_PAGE = 10
+
+    # Число строк для пагинации кэшируется по сигнатуре фильтра и сбрасывается при записи в оборудование.
+    # COUNT_MODE = 'approximate' считает не дальше COUNT_APPROX_LIMIT строк - для очень больших выборок.
+    COUNT_CACHE_TTL = 60
+    COUNT_MODE = os.environ.get('COUNT_MODE') or 'exact'
+    COUNT_APPROX_LIMIT = 10000
+
+    # Кэш отрендеренных страниц списка (LRU); 0 - выключен
+    PAGE_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+    # Сколько строк оборудования читать из БД и отдавать клиенту за раз при выгрузках
+    EXPORT_CHUNK_SIZE = 1000
+    # На сколько секунд назад сдвигать водяной знак инкрементальной выгрузки в 1С
+    EXPORT_WATERMARK_LAG = 5
+    # Сколько секунд хранить файлы фоновых выгрузок (instance/export_jobs)
+    EXPORT_JOB_RETENTION = 24 * 60 * 60
+    # Сколько строк импорта записывать одной транзакцией
+    IMPORT_BATCH_SIZE = 5000
+
     UPLOAD_FOLDER = 'static/uploads'
+    # Длинная сторона уменьшенных копий фото, создаваемых при загрузке
+    THUMBNAIL_SIZES = (160, 640)
+    # Сколько секунд не трогать фото без ссылок: загрузка могла ещё не дойти до сохранения оборудования
+    PHOTO_GC_GRACE = 24 * 60 * 60
+    # Адреса фото содержат MD5 и не меняют содержимого, так что кэшировать их можно долго
+    PHOTO_MAX_AGE = 365 * 24 * 60 * 60
+    # Кто передаёт файлы фото: None - сам Flask (с Range), 'x-accel-redirect' - nginx, 'x-sendfile' - Apache/lighttpd
+    PHOTO_SEND_MODE = os.environ.get('PHOTO_SEND_MODE') or None
+    # Внутренний (internal) location nginx, смотрящий на UPLOAD_FOLDER, для режима x-accel-redirect
+    PHOTO_ACCEL_PREFIX = os.environ.get('PHOTO_ACCEL_PREFIX', '/internal/uploads/')
+    # Современные форматы для фото в порядке предпочтения (неподдерживаемые сборкой Pillow пропускаются)
+    IMAGE_FORMATS = ('avif', 'webp')
+    # Размеры и форматы, которые можно заказать у /resize (остальные - 400, чтобы не засорять кэш)
+    RESIZE_SIZES = (64, 128, 160, 256, 320, 480, 640, 800, 1024, 1600)
+    RESIZE_FORMATS = ('jpeg', 'png', 'webp')
+    RESIZE_WORKERS = 2
+    RESIZE_CACHE_MAX_BYTES = 256 * 1024 * 1024
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
\ No newline at end of file
@@ -0,0 +1,27 @@
+"""варианты фото в современных форматах
+
+Revision ID: 0b9e47d6c318
+Revises: f3c8d5e1a972
+Create Date: 2026-10-18 18:11:52.640017
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b9e47d6c318'
+down_revision = 'f3c8d5e1a972'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Варианты для уже загруженных фото создаёт команда flask make-thumbnails
+    with op.batch_alter_table('photo', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('formats', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('photo', schema=None) as batch_op:
+        batch_op.drop_column('formats')
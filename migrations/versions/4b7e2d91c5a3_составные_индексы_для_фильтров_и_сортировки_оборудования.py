@@ -0,0 +1,34 @@
+"""Составные индексы для фильтров и сортировки оборудования
+
+Revision ID: 4b7e2d91c5a3
+Revises: 060076cb978e
+Create Date: 2026-10-18 10:12:41.527310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7e2d91c5a3'
+down_revision = '060076cb978e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('equipment', schema=None) as batch_op:
+        batch_op.create_index('ix_equipment_purchase_date', ['purchase_date', 'id'], unique=False)
+        batch_op.create_index('ix_equipment_status', ['status', 'id'], unique=False)
+        batch_op.create_index('ix_equipment_status_purchase_date', ['status', 'purchase_date', 'id'], unique=False)
+        batch_op.create_index('ix_equipment_category_purchase_date', ['category_id', 'purchase_date', 'id'], unique=False)
+        batch_op.create_index('ix_equipment_category_status', ['category_id', 'status', 'purchase_date', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('equipment', schema=None) as batch_op:
+        batch_op.drop_index('ix_equipment_category_status')
+        batch_op.drop_index('ix_equipment_category_purchase_date')
+        batch_op.drop_index('ix_equipment_status_purchase_date')
+        batch_op.drop_index('ix_equipment_status')
+        batch_op.drop_index('ix_equipment_purchase_date')
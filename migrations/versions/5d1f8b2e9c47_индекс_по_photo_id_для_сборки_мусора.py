@@ -0,0 +1,26 @@
+"""индекс по photo_id для сборки мусора
+
+Revision ID: 5d1f8b2e9c47
+Revises: 0b9e47d6c318
+Create Date: 2026-10-18 19:03:26.117384
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d1f8b2e9c47'
+down_revision = '0b9e47d6c318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('equipment', schema=None) as batch_op:
+        batch_op.create_index('ix_equipment_photo_id', ['photo_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('equipment', schema=None) as batch_op:
+        batch_op.drop_index('ix_equipment_photo_id')
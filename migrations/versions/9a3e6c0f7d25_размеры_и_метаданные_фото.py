@@ -0,0 +1,33 @@
+"""размеры и метаданные фото
+
+Revision ID: 9a3e6c0f7d25
+Revises: 5d1f8b2e9c47
+Create Date: 2026-10-18 20:14:38.552906
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a3e6c0f7d25'
+down_revision = '5d1f8b2e9c47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Значения для уже загруженных фото заполняет команда flask backfill-photo-metadata
+    with op.batch_alter_table('photo', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('width', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('height', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('byte_size', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('exif_stripped', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade():
+    with op.batch_alter_table('photo', schema=None) as batch_op:
+        batch_op.drop_column('exif_stripped')
+        batch_op.drop_column('byte_size')
+        batch_op.drop_column('height')
+        batch_op.drop_column('width')
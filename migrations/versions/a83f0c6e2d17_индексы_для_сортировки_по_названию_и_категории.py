@@ -0,0 +1,34 @@
+"""Индексы для сортировки по названию и категории
+
+Revision ID: a83f0c6e2d17
+Revises: 4b7e2d91c5a3
+Create Date: 2026-10-18 11:03:27.194408
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a83f0c6e2d17'
+down_revision = '4b7e2d91c5a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('category', schema=None) as batch_op:
+        batch_op.create_index('ix_category_name', ['name', 'id'], unique=False)
+
+    with op.batch_alter_table('equipment', schema=None) as batch_op:
+        batch_op.create_index('ix_equipment_name', ['name', 'id'], unique=False)
+        batch_op.create_index('ix_equipment_category', ['category_id', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('equipment', schema=None) as batch_op:
+        batch_op.drop_index('ix_equipment_category')
+        batch_op.drop_index('ix_equipment_name')
+
+    with op.batch_alter_table('category', schema=None) as batch_op:
+        batch_op.drop_index('ix_category_name')
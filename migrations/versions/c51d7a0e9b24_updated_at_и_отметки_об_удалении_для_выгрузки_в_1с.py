@@ -0,0 +1,46 @@
+"""updated_at и отметки об удалении для выгрузки в 1С
+
+Revision ID: c51d7a0e9b24
+Revises: a83f0c6e2d17
+Create Date: 2026-10-18 12:41:09.305117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c51d7a0e9b24'
+down_revision = 'a83f0c6e2d17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('deleted_equipment',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('equipment_id', sa.Integer(), nullable=False),
+        sa.Column('inventory_number', sa.String(length=50), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('deleted_equipment', schema=None) as batch_op:
+        batch_op.create_index('ix_deleted_equipment_deleted_at', ['deleted_at'], unique=False)
+
+    with op.batch_alter_table('equipment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_equipment_updated_at', ['updated_at', 'id'], unique=False)
+
+    # Существующие строки считаем изменёнными в момент создания
+    op.execute("UPDATE equipment SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)")
+
+
+def downgrade():
+    with op.batch_alter_table('equipment', schema=None) as batch_op:
+        batch_op.drop_index('ix_equipment_updated_at')
+        batch_op.drop_column('updated_at')
+
+    with op.batch_alter_table('deleted_equipment', schema=None) as batch_op:
+        batch_op.drop_index('ix_deleted_equipment_deleted_at')
+
+    op.drop_table('deleted_equipment')
@@ -0,0 +1,26 @@
+"""индекс по md5 фото для поиска дублей
+
+Revision ID: d2f6a3b8e415
+Revises: c51d7a0e9b24
+Create Date: 2026-10-18 15:02:47.511093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f6a3b8e415'
+down_revision = 'c51d7a0e9b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('photo', schema=None) as batch_op:
+        batch_op.create_index('ix_photo_md5_hash', ['md5_hash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('photo', schema=None) as batch_op:
+        batch_op.drop_index('ix_photo_md5_hash')
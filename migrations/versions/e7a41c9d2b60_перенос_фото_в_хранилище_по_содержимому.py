@@ -0,0 +1,64 @@
+"""перенос фото в хранилище по содержимому
+
+Revision ID: e7a41c9d2b60
+Revises: d2f6a3b8e415
+Create Date: 2026-10-18 16:20:13.904512
+
+"""
+import os
+
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+from storage import PhotoStore
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a41c9d2b60'
+down_revision = 'd2f6a3b8e415'
+branch_labels = None
+depends_on = None
+
+
+photo = sa.table('photo',
+    sa.column('id', sa.Integer),
+    sa.column('filename', sa.String),
+    sa.column('md5_hash', sa.String),
+)
+
+
+def upload_folder():
+    return os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'])
+
+
+def upgrade():
+    # Файлы из папки загрузок переносятся, остальные (static/images из seed.py) копируются:
+    # они лежат в репозитории. md5 пересчитывается по содержимому - старые записи могли хранить неверный хеш
+    store = PhotoStore(upload_folder())
+    connection = op.get_bind()
+    for row in connection.execute(sa.select(photo.c.id, photo.c.filename)).fetchall():
+        if PhotoStore.KEY.fullmatch(row.filename):
+            continue
+        source = next((path for path in (os.path.join(store.root, row.filename),
+                                         os.path.join(current_app.root_path, row.filename))
+                       if os.path.isfile(path)), None)
+        if source is None:
+            print(f'Фото {row.id}: файл {row.filename} не найден, запись оставлена как есть')
+            continue
+        moved = os.path.commonpath([os.path.abspath(source), os.path.abspath(store.root)]) == os.path.abspath(store.root)
+        key, md5_hash = store.put_file(source, move=moved)
+        connection.execute(photo.update().where(photo.c.id == row.id).values(filename=key, md5_hash=md5_hash))
+
+
+def downgrade():
+    # Возвращает плоскую раскладку: <папка загрузок>/<md5><расширение>
+    store = PhotoStore(upload_folder())
+    connection = op.get_bind()
+    for row in connection.execute(sa.select(photo.c.id, photo.c.filename)).fetchall():
+        if not PhotoStore.KEY.fullmatch(row.filename):
+            continue
+        filename = row.filename.rsplit('/', 1)[1]
+        if store.exists(row.filename):
+            os.replace(store.path(row.filename), os.path.join(store.root, filename))
+        connection.execute(photo.update().where(photo.c.id == row.id).values(filename=filename))
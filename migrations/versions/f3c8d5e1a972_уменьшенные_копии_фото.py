@@ -0,0 +1,27 @@
+"""уменьшенные копии фото
+
+Revision ID: f3c8d5e1a972
+Revises: e7a41c9d2b60
+Create Date: 2026-10-18 17:05:31.228640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c8d5e1a972'
+down_revision = 'e7a41c9d2b60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Копии для уже загруженных фото создаёт команда flask make-thumbnails
+    with op.batch_alter_table('photo', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('thumbnails', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('photo', schema=None) as batch_op:
+        batch_op.drop_column('thumbnails')
@@ -1,5 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Enum, DateTime, func, Column, Integer, String, ForeignKey, Numeric, Date, Text
+from sqlalchemy import Enum, DateTime, func, Column, Integer, String, ForeignKey, Numeric, Date, Text, JSON, Boolean
 from sqlalchemy.orm import relationship
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
@@ -38,6 +38,11 @@ class Category(db.Model):
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
 
+    # Сортировка списка оборудования по названию категории
+    __table_args__ = (
+        db.Index('ix_category_name', 'name', 'id'),
+    )
+
     def __repr__(self):
         return f'<Category {self.name}>'
 
@@ -54,17 +59,71 @@ class Equipment(db.Model):
     photo_id = db.Column(db.Integer, db.ForeignKey('photo.id'), nullable=True)
     photo = relationship("Photo", backref="equipment")
     created_at = db.Column(DateTime, default=datetime.utcnow)
+    updated_at = db.Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     responsible_persons = relationship("Person", secondary="equipment_person", back_populates="equipment")
 
+    # Индексы под фильтры и сортировки списка оборудования; id в конце - однозначный порядок для пагинации
+    __table_args__ = (
+        db.Index('ix_equipment_name', 'name', 'id'),
+        db.Index('ix_equipment_category', 'category_id', 'id'),
+        db.Index('ix_equipment_purchase_date', 'purchase_date', 'id'),
+        db.Index('ix_equipment_status', 'status', 'id'),
+        db.Index('ix_equipment_status_purchase_date', 'status', 'purchase_date', 'id'),
+        db.Index('ix_equipment_category_purchase_date', 'category_id', 'purchase_date', 'id'),
+        db.Index('ix_equipment_category_status', 'category_id', 'status', 'purchase_date', 'id'),
+        db.Index('ix_equipment_updated_at', 'updated_at', 'id'),
+        # Подсчёт ссылок на фото при сборке мусора
+        db.Index('ix_equipment_photo_id', 'photo_id'),
+    )
+
     def __repr__(self):
         return f'<Equipment {self.name}>'
 
 
+class DeletedEquipment(db.Model):
+    """Отметка об удалённом оборудовании для инкрементальной выгрузки в 1С."""
+    __tablename__ = 'deleted_equipment'
+    id = db.Column(db.Integer, primary_key=True)
+    equipment_id = db.Column(db.Integer, nullable=False)
+    inventory_number = db.Column(db.String(50), nullable=False)
+    deleted_at = db.Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<DeletedEquipment {self.inventory_number}>'
+
+
 class Photo(db.Model):
     id = Column(Integer, primary_key=True)
     filename = Column(String(255), nullable=False)
     mime_type = Column(String(255), nullable=False)
     md5_hash = Column(String(255), nullable=False)
+    # Ключи уменьшенных копий в хранилище по длинной стороне: {"160": "ab/cd/<md5>.w160.jpg", ...}
+    thumbnails = Column(JSON)
+    # Современные форматы, для которых созданы варианты файлов: ["avif", "webp"]
+    formats = Column(JSON)
+    # Размеры с учётом ориентации из EXIF и размер файла - чтобы страницам не открывать файл
+    width = Column(Integer)
+    height = Column(Integer)
+    byte_size = Column(Integer)
+    # Файл сохранён без EXIF/XMP, ориентация уже применена к пикселям
+    exif_stripped = Column(Boolean, nullable=False, default=False)
+
+    def display_size(self, box):
+        """(ширина, высота), в которых фото впишется в квадрат box без увеличения; None, если размеры неизвестны."""
+        if not self.width or not self.height:
+            return None
+        scale = min(1, box / max(self.width, self.height))
+        return round(self.width * scale), round(self.height * scale)
+
+    def thumbnail(self, size):
+        """Ключ самой маленькой копии не меньше size пикселей; оригинал, если подходящей копии нет."""
+        for width in sorted(int(width) for width in self.thumbnails or {}):
+            if width >= size:
+                return self.thumbnails[str(width)]
+        return self.filename
+
+    # Поиск уже загруженного фото с тем же содержимым при загрузке
+    __table_args__ = (db.Index('ix_photo_md5_hash', 'md5_hash'),)
 
     def __repr__(self):
         return f'<Photo {self.filename}>'
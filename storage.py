@@ -0,0 +1,151 @@
+import hashlib
+import mmap
+import os
+import re
+import shutil
+import tempfile
+
+
+def file_md5(path):
+    """Возвращает (md5, размер) файла или (None, None), если файла нет.
+
+    Файл отображается в память и хешируется одним вызовом, без копирования кусками
+    через буфер Python. Функция верхнего уровня - её можно отдавать в пул процессов.
+    """
+    md5_hash = hashlib.md5()
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            # mmap не умеет отображать пустой файл
+            if size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    md5_hash.update(mapped)
+    except FileNotFoundError:
+        return None, None
+    return md5_hash.hexdigest(), size
+
+
+class PhotoStore:
+    """Хранилище файлов фото, адресуемое по содержимому.
+
+    Файл лежит по пути <root>/ab/cd/<md5><расширение>, где ab и cd - первые байты MD5.
+    Путь вычисляется по хешу без обращения к БД и без просмотра каталогов, а одинаковые
+    файлы хранятся один раз. Запись атомарная: временный файл в <root>/.tmp + rename.
+    """
+
+    # Оригинал: ab/cd/<md5>.jpg, производные файлы рядом с ним: ab/cd/<md5>.w160.jpg
+    KEY = re.compile(r'[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32}(\.[a-z0-9]+)*')
+    TMP_DIR = '.tmp'
+
+    def __init__(self, root, chunk_size=64 * 1024):
+        self.root = root
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def normalize_extension(ext):
+        ext = ext.lower()
+        return '.jpg' if ext == '.jpeg' else ext
+
+    @classmethod
+    def key_for(cls, digest, ext=''):
+        return f'{digest[:2]}/{digest[2:4]}/{digest}{cls.normalize_extension(ext)}'
+
+    @staticmethod
+    def variant_key(key, variant, ext):
+        """Ключ производного файла (уменьшенной копии и т.п.), лежащего рядом с оригиналом key."""
+        return f'{key.split(".", 1)[0]}.{variant}{ext}'
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def scan(self):
+        """Перебирает файлы хранилища (os.DirEntry) по каталогам-шардам, без временных файлов."""
+        if not os.path.isdir(self.root):
+            return
+        for top in os.scandir(self.root):
+            if top.name == self.TMP_DIR or not top.is_dir():
+                continue
+            for shard in os.scandir(top.path):
+                if shard.is_dir():
+                    yield from (entry for entry in os.scandir(shard.path) if entry.is_file())
+
+    def scan_tmp(self):
+        """Перебирает временные файлы (в том числе брошенные прерванными записями)."""
+        directory = os.path.join(self.root, self.TMP_DIR)
+        if os.path.isdir(directory):
+            yield from os.scandir(directory)
+
+    def _tmp_file(self):
+        directory = os.path.join(self.root, self.TMP_DIR)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        # mkstemp создаёт файл 0600, а файлы хранилища может отдавать и фронт-прокси
+        os.chmod(tmp_path, 0o644)
+        return fd, tmp_path
+
+    def _publish(self, tmp_path, key):
+        """Переносит готовый временный файл на место key; если такой файл уже есть - просто удаляет временный."""
+        path = self.path(key)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            # Свежий mtime защищает переиспользованный файл от сборщика мусора, пока не появилась запись Photo
+            os.utime(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+
+    def write(self, key, save):
+        """Атомарно (пере)создаёт файл key: save(f) пишет содержимое во временный файл."""
+        fd, tmp_path = self._tmp_file()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                save(f)
+            path = self.path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def put_stream(self, stream, ext=''):
+        """Сохраняет поток, хешируя его при копировании во временный файл. Возвращает (key, md5)."""
+        md5_hash = hashlib.md5()
+        fd, tmp_path = self._tmp_file()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in iter(lambda: stream.read(self.chunk_size), b''):
+                    md5_hash.update(chunk)
+                    f.write(chunk)
+            key = self.key_for(md5_hash.hexdigest(), ext)
+            self._publish(tmp_path, key)
+            return key, md5_hash.hexdigest()
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def put_file(self, source, move=False):
+        """Кладёт существующий файл в хранилище (move=True - переносит его). Возвращает (key, md5)."""
+        if not move:
+            with open(source, 'rb') as f:
+                return self.put_stream(f, os.path.splitext(source)[1])
+
+        md5_hash, _ = file_md5(source)
+        if md5_hash is None:
+            raise FileNotFoundError(source)
+        key = self.key_for(md5_hash, os.path.splitext(source)[1])
+        if self.exists(key):
+            os.remove(source)
+            return key, md5_hash
+        fd, tmp_path = self._tmp_file()
+        os.close(fd)
+        try:
+            # rename в пределах одной ФС, иначе копирование
+            shutil.move(source, tmp_path)
+            self._publish(tmp_path, key)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return key, md5_hash